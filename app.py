@@ -3,22 +3,19 @@ import uuid
 import time
 import streamlit as st
 from dotenv import load_dotenv
-from langchain_core.messages import ToolMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
 import base64
 
 from src.sqlite_tools import search_flights
-from src.sqlite_setup import download_db
+from src.sqlite_setup import download_db, reset_db
+from src.checkpointer import create_checkpointer
+from src.airport_resolver import build_airport_index
 from src.vector_store_retriever import download_rag_doc
-from streamlit_mic_recorder import mic_recorder
-from src.google_stt import google_stt_transcribe
-from src.google_tts import google_tts_response
-from src.graph_node import builder
-from src.azure_asr import azure_stt_transcribe, azure_stt_transcribe_from_mic
-from src.azure_tts import azure_tts_response
-from src.fanolab_asr_tts import fanolab_stt_transcribe, fanolab_tts_response
-
-from google.cloud import speech, texttospeech
+from src.graph_node import builder, sensitive_tool_names
+from src.tools import pending_tool_calls, tool_output_stats
+# The speech providers (Azure speech SDK, Google Cloud, Fanolab) are imported where they are used,
+# so startup only pays for the one that is actually called
+
 from datetime import date, datetime, timedelta
 from typing import Optional, Annotated
 from typing_extensions import TypedDict
@@ -35,7 +32,9 @@ st.set_page_config(page_title="航班助手", page_icon="🤖")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "thread_id" not in st.session_state:
-    st.session_state.thread_id = str(uuid.uuid4())
+    # Kept in the URL, so reloading the page or restarting the server resumes the same conversation
+    st.session_state.thread_id = st.query_params.get("thread") or str(uuid.uuid4())
+    st.query_params["thread"] = st.session_state.thread_id
 if "agent" not in st.session_state:
     st.session_state.agent = None
 if "config" not in st.session_state:
@@ -54,12 +53,14 @@ if "voice_mode_auto_play" not in st.session_state:
     st.session_state.voice_mode_auto_play = False
 if "voice_mode_auto_play_already" not in st.session_state:
     st.session_state.voice_mode_auto_play_already = True
-if "last_message_stream_already" not in st.session_state:
-    st.session_state.last_message_stream_already = True
 if "event" not in st.session_state:
     st.session_state.event = None
 if "is_human_in_loop" not in st.session_state:
     st.session_state.is_human_in_loop = False
+if "turn_timings" not in st.session_state:
+    st.session_state.turn_timings = []
+if "session_restored" not in st.session_state:
+    st.session_state.session_restored = False
 
 
 class State(TypedDict):
@@ -68,7 +69,8 @@ class State(TypedDict):
 
 # Initialize agent and return it
 def initialize_agent():
-    memory = MemorySaver()
+    # SQLite on disk by default (CHECKPOINTER=memory for the in-process saver)
+    memory = create_checkpointer()
     graph = builder.compile(
         checkpointer=memory,
         # NEW: The graph will always halt before executing the "tools" node.
@@ -85,15 +87,26 @@ def get_agent():
     # Download the RAG and SQLite database if haven't
     download_rag_doc()
     download_db()
+    build_airport_index()
 
     # Initialize the agent
     if st.session_state.agent is None:
         st.session_state.agent = initialize_agent()
+    return st.session_state.agent, st.session_state.thread_id
+
+
+def get_google_stt_client():
     if st.session_state.google_stt_client is None:
+        from google.cloud import speech
         st.session_state.google_stt_client = speech.SpeechClient(client_options={"api_key": os.getenv("GOOGLE_API_KEY")})
+    return st.session_state.google_stt_client
+
+
+def get_google_tts_client():
     if st.session_state.google_tts_client is None:
+        from google.cloud import texttospeech
         st.session_state.google_tts_client = texttospeech.TextToSpeechClient(client_options={"api_key": os.getenv("GOOGLE_API_KEY")})
-    return st.session_state.agent, st.session_state.thread_id, st.session_state.google_stt_client, st.session_state.google_tts_client
+    return st.session_state.google_tts_client
 
 def reload_chat():
     for message in st.session_state.messages[:-1]:
@@ -103,38 +116,108 @@ def reload_chat():
         last_message = st.session_state.messages[-1]
         with st.chat_message(last_message["role"]):
             last_message_content = last_message["content"]
-            if not st.session_state.last_message_stream_already:
-                st.write_stream(stream_data(last_message_content))
-                st.session_state.last_message_stream_already = True
-            else:
-                st.write(last_message_content)
+            # Replies are streamed live by stream_turn, so there is nothing to replay here
+            st.write(last_message_content)
             if st.session_state.voice_mode and last_message_content:
                 # Azure TTS
+                from src.azure_tts import azure_tts_response
                 st.audio(azure_tts_response(text=last_message_content), format="audio/mpeg", autoplay=st.session_state.voice_mode_auto_play and (st.session_state.voice_mode_auto_play_already == False))
                 # Google TTS
-                # st.audio(google_tts_response(st.session_state.google_tts_client, last_message_content), format="audio/mpeg", autoplay=st.session_state.voice_mode_auto_play and (st.session_state.voice_mode_auto_play_already == False))
+                # from src.google_tts import google_tts_response
+                # st.audio(google_tts_response(get_google_tts_client(), last_message_content), format="audio/mpeg", autoplay=st.session_state.voice_mode_auto_play and (st.session_state.voice_mode_auto_play_already == False))
                 # Fano TTS
+                # from src.fanolab_asr_tts import fanolab_tts_response
                 # st.audio(fanolab_tts_response(text=last_message_content), format="audio/mpeg",autoplay=st.session_state.voice_mode_auto_play and (st.session_state.voice_mode_auto_play_already == False))
                 st.session_state.voice_mode_auto_play_already = True
 
-def stream_data(response_data):
-    for word in response_data.split(" "):
-        yield word + " "
-        time.sleep(0.02)
+def stream_turn(inputs, container):
+    """Run one graph turn, writing the assistant's tokens into `container` as they arrive.
+
+    Tool calls show up as status lines above the reply. Time to first token, total
+    turn time and the last prompt size (and its provider-cached part) are appended
+    to st.session_state.turn_timings.
+    Returns the last graph state and the final reply text.
+    """
+    tool_status = container.container()
+    message_placeholder = container.empty()
+    message_placeholder.write("🤔 Thinking...")
+
+    started = time.perf_counter()
+    first_token_at = None
+    reply_id, reply = None, ""
+    status = None
+    state, seen = None, set()
+    for mode, chunk in graph.stream(inputs, config, stream_mode=["messages", "values"]):
+        if mode == "messages":
+            message, metadata = chunk
+            if metadata.get("langgraph_node") != "assistant" or not isinstance(message, AIMessageChunk):
+                continue
+            if not isinstance(message.content, str) or not message.content:
+                continue
+            if message.id != reply_id:
+                # A new LLM call in the same turn, e.g. after its tools returned
+                reply_id, reply = message.id, ""
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            reply += message.content
+            message_placeholder.markdown(reply + "▌")
+            continue
+
+        # "values": the full state after each step; report the messages it added.
+        # Compare ids rather than lengths, since the context window may remove old messages.
+        messages = chunk["messages"]
+        new_messages = [m for m in messages if m.id not in seen] if state is not None else []
+        state = chunk
+        seen.update(m.id for m in messages)
+        for message in new_messages:
+            if isinstance(message, AIMessage) and message.tool_calls:
+                if status is None:
+                    status = tool_status.status("🔧 Using tools...")
+                for tc in message.tool_calls:
+                    status.write(f"🔧 `{tc['name']}` {tc['args']}")
+            elif isinstance(message, ToolMessage) and status is not None:
+                icon = "⚠️" if message.status == "error" else "✅"
+                status.write(f"{icon} `{message.name}` done")
+
+    if status is not None:
+        status.update(label="🔧 Tools finished", state="complete")
+    finished = time.perf_counter()
+    # The turn may end on a ToolMessage when it pauses for confirmation
+    final = next((m for m in reversed(state["messages"]) if isinstance(m, AIMessage)), None) if state else None
+    fast_path_intent = final.response_metadata.get("fast_path") if final is not None else None
+    llm_cache_hit = final is not None and bool(final.response_metadata.get("cache_hit"))
+    # A fast-path or response-cache turn makes no provider call, so the prompt sizes in the state are from an earlier turn
+    llm_turn = state is not None and fast_path_intent is None and not llm_cache_hit
+    timing = {
+        "time_to_first_token_s": round(first_token_at - started, 3) if first_token_at else None,
+        "total_s": round(finished - started, 3),
+        "prompt_tokens": state.get("prompt_tokens") if llm_turn else None,
+        "cached_prompt_tokens": state.get("cached_prompt_tokens") if llm_turn else None,
+    }
+    if fast_path_intent:
+        timing["fast_path"] = fast_path_intent
+    if llm_cache_hit:
+        timing["llm_cache_hit"] = True
+    st.session_state.turn_timings = (st.session_state.turn_timings + [timing])[-20:]
+    print(f"Turn finished: {timing}")
+
+    full_response = final.content if final is not None else reply
+    message_placeholder.markdown(full_response)
+    return state, full_response
 
 def reset_chat():
     # Clear messages
     st.session_state.messages = []
-    # Generate new thread ID
+    # Generate new thread ID and drop the old thread's checkpoints
+    graph.checkpointer.delete_thread(st.session_state.thread_id)
     st.session_state.thread_id = str(uuid.uuid4())
-    # Clear cache
-    st.cache_resource.clear()
-    # Reset agent
-    get_agent()
+    st.query_params["thread"] = st.session_state.thread_id
+    # Restore the demo database; the compiled graph and speech clients are kept
+    reset_db()
     # Rerun the app to refresh the UI
     st.rerun()
 
-graph, thread_id, google_stt_client, google_tts_client = get_agent()
+graph, thread_id = get_agent()
 
 # Set up the configuration
 config = {
@@ -147,6 +230,25 @@ config = {
 }
 st.session_state.config = config
 
+
+def restore_session():
+    """Rebuild the chat history and any pending confirmation from the thread's last checkpoint."""
+    snapshot = graph.get_state(config)
+    for message in snapshot.values.get("messages", []):
+        if isinstance(message, HumanMessage):
+            st.session_state.messages.append({"role": "user", "content": message.content})
+        elif isinstance(message, AIMessage) and message.content:
+            st.session_state.messages.append({"role": "assistant", "content": message.content})
+    if snapshot.next:
+        st.session_state.is_human_in_loop = True
+        st.session_state.event = snapshot.values
+
+
+if not st.session_state.session_restored:
+    if not st.session_state.messages:
+        restore_session()
+    st.session_state.session_restored = True
+
 # Streamlit UI
 st.title("航班助手 🤖")
 st.write("搜尋航班、公司政策和其他資訊")
@@ -164,7 +266,10 @@ reload_chat()
 @st.dialog("確認更改?")
 def confirm_change(graph, config):
     event = st.session_state.event
-    tool_name = event["messages"][-1].tool_calls[0]["name"]
+    # Safe calls from the same turn have already run, so only the sensitive ones are pending
+    tool_calls = pending_tool_calls(event["messages"], include=sensitive_tool_names)
+    tool_names = {tc["name"] for tc in tool_calls}
+    tool_name = tool_names.pop() if len(tool_names) == 1 else None
 
     message = "是否確認進行更改?"
     if tool_name == 'update_ticket_to_new_flight':
@@ -179,14 +284,9 @@ def confirm_change(graph, config):
 
     if st.button("確認"):
         # Just continue
-        result = graph.invoke(
-            None,
-            config,
-        )
-        last_message = result["messages"][-1]
+        _, full_response = stream_turn(None, st.container())
 
-        if last_message:
-            full_response = last_message.content
+        if full_response is not None:
             # Add user message to chat history
             st.session_state.messages.append({"role": "user", "content": "確認要求"})
             st.session_state.messages.append({"role": "assistant", "content": full_response})
@@ -197,20 +297,19 @@ def confirm_change(graph, config):
     if st.button("拒絕"):
         # Satisfy the tool invocation by
         # providing instructions on the requested changes / change of mind
-        result = graph.invoke(
+        _, full_response = stream_turn(
             {
                 "messages": [
                     ToolMessage(
-                        tool_call_id=event["messages"][-1].tool_calls[0]["id"],
+                        tool_call_id=tc["id"],
                         content=f"API call denied by user. Continue assisting, accounting for the user's input.",
                     )
+                    for tc in tool_calls
                 ]
             },
-            config,
+            st.container(),
         )
-        last_message = result["messages"][-1]
-        if last_message:
-            full_response = last_message.content
+        if full_response is not None:
             # Add user message to chat history
             st.session_state.messages.append({"role": "user", "content": "拒絕要求"})
             st.session_state.messages.append({"role": "assistant", "content": full_response})
@@ -231,44 +330,20 @@ def handle_chat_input(prompt_text):
         with st.chat_message("user"):
             st.write(prompt_text)
 
-        with st.chat_message("assistant"):
-            message_placeholder = st.empty()
-            message_placeholder.write("🤔 Thinking...")
-
         try:
-            # Get response from langgraph agent
+            # Stream the langgraph agent's reply as it is generated
             inputs = {"messages": [("user", prompt_text)]}
-            events = graph.stream(inputs, config, stream_mode="values")
-
-            last_message = None
-            for event in events:
-                message = event["messages"][-1]
-                last_message = event["messages"][-1]
-
-                # tool_name = message.name
-                if isinstance(message, tuple):
-                    response_text = str(message)
-                else:
-                    response_text = message.pretty_print() if message.pretty_print() else ""
+            state, full_response = stream_turn(inputs, st.chat_message("assistant"))
 
             # Human in the loop
             snapshot = graph.get_state(config)
-            # print("Snapshot:", snapshot[-1])
-            # print("Event:", event)
             if snapshot.next:
                 st.session_state.is_human_in_loop = True
-                st.session_state.event = event
+                st.session_state.event = state
             # Store response in chat history
-            if last_message:
-                full_response = last_message.content
-                # message_placeholder.empty()
-
-                # st.write_stream(stream_data(full_response))
-                # Add user message to chat history
-                st.session_state.messages.append({"role": "user", "content": prompt_text})
-                st.session_state.messages.append({"role": "assistant", "content": full_response})
-                st.session_state.last_message_stream_already = False
-                st.session_state.voice_mode_auto_play_already = False
+            st.session_state.messages.append({"role": "user", "content": prompt_text})
+            st.session_state.messages.append({"role": "assistant", "content": full_response})
+            st.session_state.voice_mode_auto_play_already = False
 
         except Exception as e:
             # message_placeholder.write(f"Sorry, I encountered an error: {str(e)}")
@@ -280,6 +355,8 @@ def handle_chat_input(prompt_text):
 if st.session_state.voice_mode:
 
     # Google TTS
+    # from streamlit_mic_recorder import mic_recorder
+    # from src.google_stt import google_stt_transcribe
     # audio = mic_recorder(
     #     start_prompt="⏺️ Start (Google TTS)", stop_prompt="⏹️ End",
     #     just_once=True,
@@ -292,7 +369,7 @@ if st.session_state.voice_mode:
     # )
     # if audio:
     #     try:
-    #         speech_to_text = google_stt_transcribe(st.session_state.google_stt_client, audio['bytes'])
+    #         speech_to_text = google_stt_transcribe(get_google_stt_client(), audio['bytes'])
     #         if speech_to_text:
     #             handle_chat_input(speech_to_text)
     #             st.rerun()
@@ -304,6 +381,7 @@ if st.session_state.voice_mode:
     if mic_button:
         with st.spinner("Listening... Please speak now and pause when finished"):
             try:
+                from src.azure_asr import azure_stt_transcribe_from_mic
                 speech_to_text = azure_stt_transcribe_from_mic()
                 if speech_to_text and speech_to_text.startswith("Recognition failed") == False:
                     handle_chat_input(speech_to_text)
@@ -311,6 +389,8 @@ if st.session_state.voice_mode:
             except Exception as e:
                 st.error(f"Error with microphone transcription: {str(e)}")
     # Fano Lab
+    # from streamlit_mic_recorder import mic_recorder
+    # from src.fanolab_asr_tts import fanolab_stt_transcribe
     # audio_fanolab = mic_recorder(
     #     start_prompt="⏺️ Start (Fano Lab TTS)", stop_prompt="⏹️ End",
     #     just_once=True,
@@ -363,33 +443,43 @@ def about_tab():
         #     handle_chat_input(query)
         #     st.rerun()
 
-import sqlite3
 import pandas as pd
-
-SAVE_DIR = "./src/sqlite_db"
-DB_NAME = "travel2.sqlite"
-DOC_PATH = os.path.join(SAVE_DIR, DB_NAME)
-
-def run_query(query):
-    """Run a SQL query on the SQLite database and return the results as a DataFrame."""
-    try:
-        with sqlite3.connect(DOC_PATH) as conn:
-            df = pd.read_sql_query(query, conn)
-        return df
-    except Exception as e:
-        st.error(f"An error occurred: {e}")
-        return None
+from src.fast_path import fast_path_stats
+from src import vector_store_retriever
+from src.vector_store_retriever import embedding_cache_stats, policy_prefetcher, retrieval_stats
+from src.itinerary_cache import get_itinerary, itinerary_cache_stats
+from src.llm_cache import llm_cache_stats
+from src.sqlite_pool import connection, db_version, pool_stats
+from src.sqlite_queries import AIRPORTS_QUERY, build_flight_search_query
+
+POLICY_PATH = "./src/rag_doc/swiss_faq.md"
+# The demo passenger shown under "Passenger Info"
+DEMO_PASSENGER_ID = "8149 604011"
+
+# Sidebar data is cached across reruns, keyed by the database version (bumped on reset and
+# ticket writes) or by the policy document's mtime and size.
+def document_version(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
 
 def fetch_airports():
     """Fetch airport data from the database."""
-    conn = sqlite3.connect(DOC_PATH)
-    query = "SELECT airport_code, airport_name, city FROM airports_data WHERE 1 = 1"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    with connection() as conn:
+        df = pd.read_sql_query(AIRPORTS_QUERY, conn)
     return df
 
 
+@st.cache_data(show_spinner=False)
+def fetch_airport_options(version):
+    """Airport codes for the search selectboxes."""
+    airports_df = fetch_airports()
+    # return [f"{row.airport_code} - {row.city} ({row.airport_name})" for row in airports_df.itertuples()]
+    return airports_df["airport_code"].tolist()
+
+
+@st.cache_data(show_spinner=False, max_entries=128)
 def search_flights(
+        version,
         departure_airport: Optional[str] = None,
         arrival_airport: Optional[str] = None,
         start_time: Optional[date | datetime] = None,
@@ -397,37 +487,16 @@ def search_flights(
         limit: int = 20,
 ):
     """Search for flights based on departure airport, arrival airport, and departure time range."""
-    conn = sqlite3.connect(DOC_PATH)
-
-    query = "SELECT * FROM flights WHERE 1 = 1"
-    params = []
-
-    if departure_airport:
-        query += " AND departure_airport = ?"
-        params.append(departure_airport)
-
-    if arrival_airport:
-        query += " AND arrival_airport = ?"
-        params.append(arrival_airport)
-
-    if start_time:
-        query += " AND scheduled_departure >= ?"
-        params.append(start_time)
-
-    if end_time:
-        query += " AND scheduled_departure <= ?"
-        params.append(end_time)
-
-    query += " LIMIT ?"
-    params.append(limit)
+    query, params = build_flight_search_query(
+        departure_airport, arrival_airport, start_time, end_time, limit
+    )
 
     try:
-        df = pd.read_sql_query(query, conn, params=params)
+        with connection() as conn:
+            df = pd.read_sql_query(query, conn, params=params)
     except Exception as e:
         print(f"An error occurred: {e}")
         df = pd.DataFrame()  # Return an empty DataFrame in case of error
-    finally:
-        conn.close()
 
     return df
 
@@ -452,24 +521,7 @@ def sqlite_query_tab():
     st.title("Database Search")
 
     # Fetch airport data
-    airports_df = fetch_airports()
-    # airport_options = airports_df.apply(lambda row: f"{row['airport_code']} - {row['city']} ({row['airport_name']})",
-    #                                     axis=1).tolist()
-    airport_options = airports_df.apply(lambda row: f"{row['airport_code']}",
-                                        axis=1).tolist()
-    query = """
-    SELECT 
-        t.ticket_no, t.book_ref,
-        f.flight_id, f.flight_no, f.departure_airport, f.arrival_airport, f.scheduled_departure, f.scheduled_arrival,
-        bp.seat_no, tf.fare_conditions
-    FROM 
-        tickets t
-        LEFT JOIN ticket_flights tf ON t.ticket_no = tf.ticket_no
-        LEFT JOIN flights f ON tf.flight_id = f.flight_id
-        LEFT JOIN boarding_passes bp ON bp.ticket_no = t.ticket_no AND bp.flight_id = f.flight_id
-    WHERE 
-        t.passenger_id = '8149 604011'
-    """
+    airport_options = fetch_airport_options(db_version())
 
     # Input fields
     departure_airport = st.selectbox("Departure Airport", [""] + airport_options)
@@ -479,9 +531,7 @@ def sqlite_query_tab():
     limit = st.slider("Number of results", min_value=1, max_value=50, value=10)
 
     if st.button("Flight Search"):
-        client_info = run_query(query)
-        if client_info is not None:
-            st.session_state.client_info = client_info
+        st.session_state.client_info = pd.DataFrame(get_itinerary(DEMO_PASSENGER_ID))
 
         #Flight info
         departure_code = departure_airport.split(" - ")[0] if departure_airport else None
@@ -492,6 +542,7 @@ def sqlite_query_tab():
         end_datetime = datetime.combine(end_date, datetime.max.time())
 
         flight_info = search_flights(
+            db_version(),
             departure_airport=departure_code,
             arrival_airport=arrival_code,
             start_time=start_datetime,
@@ -506,16 +557,48 @@ def sqlite_query_tab():
     #Display pd
     reload_pd()
 
-
-def policy_tab():
-    st.title("Swiss Airlines Policy")
-
+    with st.expander("Database stats"):
+        st.json({
+            "connection_pool": pool_stats(),
+            "itinerary_cache": itinerary_cache_stats(),
+            "llm_cache": llm_cache_stats(),
+            "embedding_cache": embedding_cache_stats(),
+            "checkpointer": graph.checkpointer.stats() if hasattr(graph.checkpointer, "stats") else {},
+        })
+    with st.expander("Tool output sizes"):
+        st.json(tool_output_stats())
+    with st.expander("Fast path"):
+        st.json(fast_path_stats())
+    with st.expander("Policy lookups"):
+        st.json({
+            "prefetch": policy_prefetcher.stats(),
+            "retrieval": retrieval_stats(),
+            "last_ingestion": vector_store_retriever.last_ingestion,
+        })
+    with st.expander("Response times"):
+        timings = st.session_state.turn_timings
+        reported = [t for t in timings if t.get("cached_prompt_tokens") is not None]
+        prompt_tokens = sum(t["prompt_tokens"] for t in reported)
+        cached_tokens = sum(t["cached_prompt_tokens"] for t in reported)
+        st.write(f"Prompt cache: {cached_tokens} / {prompt_tokens} prompt tokens cached"
+                 + (f" ({cached_tokens / prompt_tokens:.0%})" if prompt_tokens else ""))
+        st.json(timings[::-1])
+
+
+@st.cache_data(show_spinner=False)
+def render_policy_html(path, version):
     # Read the content of the markdown file
-    with open("./src/rag_doc/swiss_faq.md", "r", encoding="utf-8") as file:
+    with open(path, "r", encoding="utf-8") as file:
         md_content = file.read()
 
     # Convert markdown to HTML
-    html_content = markdown.markdown(md_content)
+    return markdown.markdown(md_content)
+
+
+def policy_tab():
+    st.title("Swiss Airlines Policy")
+
+    html_content = render_policy_html(POLICY_PATH, document_version(POLICY_PATH))
 
     # Display the HTML content
     st.markdown(html_content, unsafe_allow_html=True)
@@ -0,0 +1,141 @@
+"""Latency and recall@4 of lexical-only, vector-only and hybrid policy retrieval, offline.
+
+The chunks come from src/rag_doc/swiss_faq.md when it has been downloaded, otherwise from
+a synthetic FAQ. The embedding API is replaced by hashed character-trigram vectors, which
+tolerate typos and inflections roughly the way a real model does. Each query embedding
+waits --embed-latency-ms to stand in for the remote call. Queries are 4-word windows
+taken from a chunk, verbatim ("exact") or with typos ("typo"). A query counts as a hit
+when its source chunk is in the top 4.
+
+    python -m benchmarks.bench_hybrid_retrieval [--queries 100] [--embed-latency-ms 150]
+"""
+import argparse
+import hashlib
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from src.hybrid_retriever import HybridRetriever, tokenize
+from src.numpy_vector_store import NumpyVectorStore
+from src.vector_store_retriever import DOC_PATH, split_policy_doc
+
+DIMENSIONS = 1024
+MODES = ["lexical", "vector", "hybrid"]
+TOPICS = {
+    "refund": "refund refundable reimbursement voucher credit card original payment processing weeks",
+    "cancellation": "cancellation cancel deadline penalty waiver non-refundable taxes airport charges",
+    "rebooking": "rebooking rebook change date itinerary fare difference flexible change fee",
+    "baggage": "baggage luggage suitcase checked allowance kilograms excess oversized sports equipment",
+    "check-in": "check-in online counter boarding pass kiosk mobile documents deadline",
+    "fares": "economy light classic flex business first fare family conditions",
+    "pets": "pets animals dog cat cabin container veterinary certificate hold",
+    "special assistance": "wheelchair assistance reduced mobility medical oxygen escort request",
+    "infants": "infants children unaccompanied minors bassinet stroller age discount",
+    "delays": "delay missed connection compensation overnight hotel meal vouchers regulation",
+}
+FILLER = "the a passengers flight swiss ticket booking please note that within before after hours days may must".split()
+
+
+class TrigramEmbedding(Embeddings):
+    """Hashed bag of character trigrams, normalized; `latency` is added to each query embedding."""
+    model = "trigram-hash"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(DIMENSIONS, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                vector[int(hashlib.md5(padded[i:i + 3].encode()).hexdigest()[:8], 16) % DIMENSIONS] += 1
+        return (vector / (np.linalg.norm(vector) or 1)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+def load_chunks() -> list:
+    if os.path.exists(DOC_PATH):
+        return split_policy_doc(DOC_PATH)
+    rng = random.Random(0)
+    chunks = []
+    for topic, vocabulary in TOPICS.items():
+        words = vocabulary.split()
+        for section in range(4):
+            body = " ".join(rng.choice(words) if rng.random() < 0.5 else rng.choice(FILLER) for _ in range(150))
+            chunks.append(Document(page_content=f"{topic.title()} ({section + 1}). {body}"))
+    return chunks
+
+
+def typo(word: str, rng: random.Random) -> str:
+    if len(word) < 5:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:]
+
+
+def make_queries(chunks: list, count: int, seed: int = 1) -> list[tuple[str, str, str]]:
+    """(kind, query, source chunk text) triples."""
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < count * 2:
+        chunk = rng.choice(chunks)
+        words = [w for w in re.findall(r"[A-Za-z][A-Za-z-]+", chunk.page_content) if tokenize(w)]
+        if len(words) < 4:
+            continue
+        start = rng.randrange(len(words) - 3)
+        window = words[start:start + 4]
+        queries.append(("exact", " ".join(window), chunk.page_content))
+        queries.append(("typo", " ".join(typo(w, rng) for w in window), chunk.page_content))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=100, help="queries of each kind")
+    parser.add_argument("--embed-latency-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    chunks = load_chunks()
+    queries = make_queries(chunks, args.queries)
+    source = "swiss_faq.md" if os.path.exists(DOC_PATH) else "synthetic FAQ"
+    print(f"{len(chunks)} chunks ({source}), {len(queries)} queries, simulated embedding latency {args.embed_latency_ms:.0f} ms")
+    print(f"{'mode':<9}{'recall@4':>10}{'exact':>8}{'typo':>8}{'mean ms':>10}{'p50 ms':>9}{'embeddings':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        embedding = TrigramEmbedding(latency=args.embed_latency_ms / 1000)
+        store = NumpyVectorStore.from_documents(chunks, embedding, persist_directory=os.path.join(tmp, "index"))
+        for mode in MODES:
+            retriever = HybridRetriever(chunks, store, mode=mode)
+            hits = {"exact": [], "typo": []}
+            latencies = []
+            for kind, query, expected in queries:
+                started = time.perf_counter()
+                docs = retriever.search(query, k=4)
+                latencies.append(time.perf_counter() - started)
+                hits[kind].append(any(doc.page_content == expected for doc in docs))
+            stats = retriever.stats()
+            embedded = stats["fused"] + stats["vector_only"]
+            all_hits = hits["exact"] + hits["typo"]
+            print(f"{mode:<9}{sum(all_hits) / len(all_hits):>10.3f}"
+                  f"{sum(hits['exact']) / len(hits['exact']):>8.3f}{sum(hits['typo']) / len(hits['typo']):>8.3f}"
+                  f"{statistics.mean(latencies) * 1000:>10.1f}{statistics.median(latencies) * 1000:>9.1f}"
+                  f"{embedded:>7}/{len(queries):<4}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Cold-start import time of the app and of the agent graph alone.
+
+Each target is imported in a fresh interpreter under `python -X importtime`, a few times,
+and the median is reported along with the slowest top-level imports. "app" runs the
+top-level import statements of app.py (not the Streamlit script itself); "graph" is
+`import src.graph_node`. Heavy provider packages that should only load on first use are
+listed when they show up anyway.
+
+    python -m benchmarks.bench_import_time [--runs 3] [--top 10] [--targets app graph]
+"""
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Packages that are loaded lazily and should not be paid for at startup
+LAZY_PACKAGES = [
+    "chromadb", "langchain_chroma", "langchain_openai", "openai",
+    "azure.cognitiveservices.speech", "google.cloud.speech", "google.cloud.texttospeech", "googleapiclient",
+]
+
+
+def app_imports() -> str:
+    """The module-level import statements of app.py, as one script."""
+    with open(os.path.join(ROOT, "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+TARGETS = {
+    "app": app_imports,
+    "graph": lambda: "import src.graph_node",
+}
+
+
+def measure(code: str) -> tuple[float, list[tuple[int, int, int, str]]]:
+    """Wall time of a fresh interpreter importing `code`, and its importtime rows (self us, cumulative us, depth, name)."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, "PYTHONPATH": ROOT},
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return wall, rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    args = parser.parse_args()
+
+    for target in args.targets:
+        code = TARGETS[target]()
+        runs = [measure(code) for _ in range(args.runs)]
+        walls = [wall for wall, _ in runs]
+        _, rows = min(runs, key=lambda run: run[0])
+        imports_s = sum(self_us for self_us, _, _, _ in rows) / 1e6
+        loaded = {name for _, _, _, name in rows}
+
+        print(f"\n== {target}: median {statistics.median(walls):.2f} s wall "
+              f"(min {min(walls):.2f}, max {max(walls):.2f}), {imports_s:.2f} s in imports, {len(loaded)} modules")
+        print(f"{'cumulative ms':>13}  {'self ms':>8}  module")
+        top_level = sorted((row for row in rows if row[2] == 0), key=lambda row: -row[1])
+        for self_us, cumulative_us, _, name in top_level[:args.top]:
+            print(f"{cumulative_us / 1000:>13.1f}  {self_us / 1000:>8.1f}  {name}")
+        eager = [package for package in LAZY_PACKAGES if package in loaded]
+        print("lazy packages loaded at import: " + (", ".join(eager) if eager else "none"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Token cost of the itinerary block that user_info() puts into every assistant prompt.
+
+Compares the old form (str() of the rows from fetch_user_flight_information) and JSON
+with format_itinerary from src/itinerary_format.py, on travel2-shaped rows.
+
+    python -m benchmarks.bench_itinerary_format [--tickets 1 3 10 30]
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+from src.context_window import _encoding, count_tokens
+from src.itinerary_format import format_itinerary
+
+AIRPORTS = ["BSL", "ZRH", "GVA", "CDG", "LHR", "HKG", "FRA", "MUC", "AMS", "JFK"]
+PASSENGER = {"name": "Jacky Chan", "email": "jacky.chan@example.com"}
+
+
+def make_rows(tickets: int, seed: int = 1) -> list[dict]:
+    """Rows shaped like USER_FLIGHTS_QUERY results plus the copied passenger fields."""
+    rng = random.Random(seed)
+    tz = timezone(timedelta(hours=-4))
+    start = datetime(2024, 5, 1, tzinfo=tz)
+    rows = []
+    for i in range(tickets):
+        departure = start + timedelta(minutes=rng.randint(0, 60 * 24 * 30), microseconds=rng.randint(0, 999999))
+        origin, destination = rng.sample(AIRPORTS, 2)
+        checked_in = rng.random() < 0.5
+        rows.append({
+            "ticket_no": f"72400054329{rng.randint(0, 99999):05d}",
+            "book_ref": f"{rng.randint(0, 0xFFFFFF):06X}",
+            "flight_id": rng.randint(1000, 30000),
+            "flight_no": f"LX{rng.randint(0, 999):04d}",
+            "departure_airport": origin,
+            "arrival_airport": destination,
+            "scheduled_departure": departure.isoformat(" "),
+            "scheduled_arrival": (departure + timedelta(minutes=90)).isoformat(" "),
+            "seat_no": f"{rng.randint(1, 30)}{rng.choice('ABCDEF')}" if checked_in else None,
+            "fare_conditions": rng.choice(["Economy", "Comfort", "Business"]),
+            **PASSENGER,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, nargs="+", default=[1, 3, 10, 30])
+    args = parser.parse_args()
+
+    counter = "tiktoken o200k_base" if _encoding() is not None else "estimate (tiktoken encoding unavailable)"
+    print(f"token counts: {counter}")
+    print(f"{'tickets':>7}  {'str(rows)':>10}  {'json':>8}  {'compact':>8}  {'saved':>6}")
+    for tickets in args.tickets:
+        rows = make_rows(tickets)
+        compact = format_itinerary(rows)
+        old = count_tokens(str(rows))
+        as_json = count_tokens(json.dumps(rows, ensure_ascii=False))
+        new = count_tokens(compact)
+        # Every value except the sub-minute part of the times must survive
+        for row in rows:
+            for key, value in row.items():
+                if value is not None and not key.startswith("scheduled_"):
+                    assert str(value) in compact, (key, value)
+        print(f"{tickets:>7}  {old:>10}  {as_json:>8}  {new:>8}  {1 - new / old:>6.0%}")
+
+    print("\nexample (3 tickets):\n" + format_itinerary(make_rows(3)))
+
+
+if __name__ == "__main__":
+    main()
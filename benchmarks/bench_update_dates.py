@@ -0,0 +1,120 @@
+"""Timing and peak-RSS benchmark for the date rebasing done on every reset.
+
+Compares the original pandas round-trip against the in-place SQL rebasing in
+src/sqlite_setup.py. Each implementation runs in its own subprocess so peak RSS
+is measured independently.
+
+    python -m benchmarks.bench_update_dates [path/to/travel2.backup.sqlite] [--repeat N]
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from src.sqlite_setup import BACKUP_PATH, update_dates
+
+
+def update_dates_pandas(file, backup_path):
+    """The previous implementation: load every table into pandas and write them all back."""
+    shutil.copy(backup_path, file)
+    conn = sqlite3.connect(file)
+
+    tables = pd.read_sql(
+        "SELECT name FROM sqlite_master WHERE type='table';", conn
+    ).name.tolist()
+    tdf = {}
+    for t in tables:
+        tdf[t] = pd.read_sql(f"SELECT * from {t}", conn)
+
+    example_time = pd.to_datetime(
+        tdf["flights"]["actual_departure"].replace("\\N", pd.NaT)
+    ).max()
+    current_time = pd.to_datetime("now").tz_localize(example_time.tz)
+    time_diff = current_time - example_time + pd.Timedelta(days=31)
+
+    tdf["bookings"]["book_date"] = (
+        pd.to_datetime(tdf["bookings"]["book_date"].replace("\\N", pd.NaT), utc=True)
+        + time_diff
+    )
+
+    datetime_columns = [
+        "scheduled_departure",
+        "scheduled_arrival",
+        "actual_departure",
+        "actual_arrival",
+    ]
+    for column in datetime_columns:
+        tdf["flights"][column] = (
+            pd.to_datetime(tdf["flights"][column].replace("\\N", pd.NaT)) + time_diff
+        )
+
+    for table_name, df in tdf.items():
+        df.to_sql(table_name, conn, if_exists="replace", index=False)
+    conn.commit()
+    conn.close()
+    return file
+
+
+IMPLEMENTATIONS = {
+    "pandas": update_dates_pandas,
+    "sql": update_dates,
+}
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_once(name: str, backup_path: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        target = os.path.join(tmp, "travel2.sqlite")
+        rss_before = peak_rss_mib()
+        started = time.perf_counter()
+        IMPLEMENTATIONS[name](target, backup_path)
+        elapsed = time.perf_counter() - started
+        return {
+            "implementation": name,
+            "seconds": elapsed,
+            "rss_after_imports_mib": rss_before,
+            "peak_rss_mib": peak_rss_mib(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("backup_path", nargs="?", default=BACKUP_PATH)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", choices=sorted(IMPLEMENTATIONS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_once(args.child, args.backup_path)))
+        return
+
+    print(f"Backup: {args.backup_path} ({os.path.getsize(args.backup_path) / 2**20:.1f} MiB)")
+    print(f"{'implementation':<16}{'best s':>10}{'mean s':>10}{'peak RSS MiB':>16}{'RSS delta MiB':>16}")
+    for name in IMPLEMENTATIONS:
+        runs = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_update_dates", args.backup_path, "--child", name],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        seconds = [run["seconds"] for run in runs]
+        peak = max(run["peak_rss_mib"] for run in runs)
+        delta = max(run["peak_rss_mib"] - run["rss_after_imports_mib"] for run in runs)
+        print(f"{name:<16}{min(seconds):>10.3f}{sum(seconds) / len(seconds):>10.3f}{peak:>16.1f}{delta:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Query latency, load time and RSS of the policy retrieval backends.
+
+Builds a Chroma store and NumPy indexes (float32 and int8) from the same chunks, then loads
+each one in its own subprocess and times similarity_search_by_vector over a fixed set of
+query vectors. Embeddings come from a deterministic fake model, so no API key is needed and
+the timings exclude the embedding request. Chunks are taken from src/rag_doc/swiss_faq.md
+when it has been downloaded, otherwise synthetic FAQ paragraphs are used; --scale repeats
+the corpus to see how the backends grow.
+
+    python -m benchmarks.bench_vector_backends [--scale 1 10] [--queries 200] [--k 4]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+DIMENSIONS = 1536  # text-embedding-3-small
+BACKENDS = ["chroma", "numpy-float32", "numpy-int8"]
+DOC_PATH = os.path.join("src", "rag_doc", "swiss_faq.md")
+TOPICS = ["refund", "cancellation", "baggage", "check-in", "seat selection", "upgrade", "pets", "name change",
+          "missed connection", "special meals", "travel insurance", "infants", "group booking", "lounge access"]
+
+
+def fake_embedding():
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    class UnitFakeEmbedding(DeterministicFakeEmbedding):
+        """Deterministic unit vectors, like the real model's, so cosine and L2 rank the same."""
+        model: str = "fake-deterministic"
+
+        def embed_query(self, text):
+            vector = super().embed_query(text)
+            norm = sum(x * x for x in vector) ** 0.5
+            return [x / norm for x in vector]
+
+        def embed_documents(self, texts):
+            return [self.embed_query(text) for text in texts]
+
+    return UnitFakeEmbedding(size=DIMENSIONS)
+
+
+def load_chunks(scale: int) -> list:
+    from langchain_core.documents import Document
+
+    if os.path.exists(DOC_PATH):
+        from src.vector_store_retriever import split_policy_doc
+        chunks = split_policy_doc(DOC_PATH)
+    else:
+        rng = random.Random(0)
+        chunks = [
+            Document(page_content=f"{topic.title()} policy, section {i}. " + " ".join(
+                rng.choice(["Passengers", "may", "request", "a", "change", "within", "24", "hours", "fees", "apply",
+                            "Swiss", "tickets", "are", "refundable", "depending", "on", "fare", "conditions"])
+                for _ in range(150)), metadata={"source": "synthetic"})
+            for i, topic in enumerate(TOPICS * 4)
+        ]
+    return [
+        Document(page_content=f"{doc.page_content}\n[copy {copy}]" if copy else doc.page_content, metadata=doc.metadata)
+        for copy in range(scale) for doc in chunks
+    ]
+
+
+def build(backend: str, directory: str, chunks: list):
+    embedding = fake_embedding()
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        Chroma.from_documents(chunks, embedding, persist_directory=directory, collection_name="policies")
+    else:
+        from src.numpy_vector_store import NumpyVectorStore
+        NumpyVectorStore.from_documents(chunks, embedding, persist_directory=directory, dtype=backend.split("-")[1])
+
+
+def rss_mib() -> float:
+    # Current RSS. ru_maxrss is no use here: a child starts with the peak of the parent it was forked from
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmRSS:")) / 1024
+
+
+def run_child(backend: str, directory: str, queries: int, k: int) -> dict:
+    rss_start = rss_mib()
+    started = time.perf_counter()
+    embedding = fake_embedding()
+    if backend == "chroma":
+        from langchain_chroma import Chroma
+        store = Chroma(persist_directory=directory, embedding_function=embedding, collection_name="policies")
+    else:
+        from src.numpy_vector_store import NumpyVectorStore
+        store = NumpyVectorStore.load(directory, embedding)
+    load_s = time.perf_counter() - started
+    rss_loaded = rss_mib()
+
+    vectors = [embedding.embed_query(f"{random.Random(i).choice(TOPICS)} question {i}") for i in range(queries)]
+    store.similarity_search_by_vector(vectors[0], k=k)  # warm-up
+    latencies, results = [], []
+    for vector in vectors:
+        started = time.perf_counter()
+        docs = store.similarity_search_by_vector(vector, k=k)
+        latencies.append(time.perf_counter() - started)
+        results.append([doc.page_content for doc in docs])
+    latencies.sort()
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "rss_start_mib": rss_start,
+        "rss_loaded_mib": rss_loaded,
+        "rss_mib": rss_mib(),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.dir, args.queries, args.k)))
+        return
+
+    for scale in args.scale:
+        chunks = load_chunks(scale)
+        print(f"\n{len(chunks)} chunks x {DIMENSIONS} dims, {args.queries} queries, k={args.k}")
+        print(f"{'backend':<15}{'load s':>8}{'p50 ms':>9}{'p95 ms':>9}{'RSS MiB':>10}{'load +MiB':>11}"
+              f"{'disk MiB':>10}{'recall@k':>10}")
+        with tempfile.TemporaryDirectory() as tmp:
+            runs = {}
+            for backend in BACKENDS:
+                directory = os.path.join(tmp, backend)
+                build(backend, directory, chunks)
+                disk = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(directory) for f in files)
+                output = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_vector_backends", "--child", backend, "--dir", directory,
+                     "--queries", str(args.queries), "--k", str(args.k)],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                runs[backend] = {**json.loads(output.strip().splitlines()[-1]), "disk_mib": disk / 2**20}
+
+            # Exact float32 search is the reference for the approximate (HNSW) and quantized results
+            reference = runs["numpy-float32"]["results"]
+            for backend, run in runs.items():
+                found = sum(len(set(got) & set(want)) for got, want in zip(run["results"], reference))
+                recall = found / sum(len(want) for want in reference)
+                print(f"{backend:<15}{run['load_s']:>8.3f}{run['p50_ms']:>9.3f}{run['p95_ms']:>9.3f}"
+                      f"{run['rss_mib']:>10.1f}{run['rss_loaded_mib'] - run['rss_start_mib']:>11.1f}"
+                      f"{run['disk_mib']:>10.2f}{recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
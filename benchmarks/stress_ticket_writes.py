@@ -0,0 +1,145 @@
+"""Concurrent stress test for the ticket write path in src/ticket_writes.py.
+
+Builds a throwaway travel-shaped database, then hammers it from many threads:
+
+1. rebook: every worker keeps moving random tickets of one passenger to random
+   future flights. Afterwards each ticket must still have exactly one flight, and it
+   must be a flight that some successful rebooking assigned (or its original one).
+2. cancel: every worker tries to cancel every ticket. Each ticket must be cancelled
+   exactly once; all other attempts must see "ticket not found".
+
+    python -m benchmarks.stress_ticket_writes [--workers 16] [--ops 200] [--tickets 20]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from src.sqlite_migrations import apply_migrations
+from src.sqlite_pool import DB_PATH, pool_stats
+from src.ticket_writes import WriteResult, rebook_ticket, cancel_ticket_flights
+
+PASSENGER_ID = "8149 604011"
+
+
+def build_database(path: str, tickets: int, flights: int):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE flights (flight_id INTEGER, flight_no TEXT, scheduled_departure TEXT, scheduled_arrival TEXT,
+                              departure_airport TEXT, arrival_airport TEXT, status TEXT, aircraft_code TEXT,
+                              actual_departure TEXT, actual_arrival TEXT);
+        CREATE TABLE tickets (ticket_no TEXT, book_ref TEXT, passenger_id TEXT);
+        CREATE TABLE ticket_flights (ticket_no TEXT, flight_id INTEGER, fare_conditions TEXT, amount INTEGER);
+        CREATE TABLE boarding_passes (ticket_no TEXT, flight_id INTEGER, boarding_no INTEGER, seat_no TEXT);
+    """)
+    tz = timezone(timedelta(hours=3))
+    start = datetime.now(tz) + timedelta(days=1)
+    conn.executemany(
+        "INSERT INTO flights (flight_id, flight_no, scheduled_departure, departure_airport, arrival_airport) VALUES (?, ?, ?, ?, ?)",
+        [
+            (i, f"LX{i:04d}", (start + timedelta(hours=i)).isoformat(" ", timespec="microseconds"), "BSL", "CDG")
+            for i in range(1, flights + 1)
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO tickets VALUES (?, ?, ?)",
+        [(f"{i:013d}", f"B{i:05d}", PASSENGER_ID) for i in range(tickets)],
+    )
+    conn.executemany(
+        "INSERT INTO ticket_flights VALUES (?, ?, 'Economy', 100)",
+        [(f"{i:013d}", 1) for i in range(tickets)],
+    )
+    apply_migrations(conn)
+    conn.close()
+
+
+def run_phase(name: str, workers: int, jobs: list) -> Counter:
+    counts = Counter()
+    lock = threading.Lock()
+
+    def work(job):
+        result, _ = job()
+        with lock:
+            counts[result] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(work, jobs))
+    elapsed = time.perf_counter() - started
+    summary = ", ".join(f"{result.value}={count}" for result, count in sorted(counts.items()))
+    print(f"{name:<8} {len(jobs):>6} ops in {elapsed:6.2f} s  {len(jobs) / elapsed:8.0f} ops/s  [{summary}]")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--ops", type=int, default=200, help="rebookings per worker")
+    parser.add_argument("--tickets", type=int, default=20)
+    parser.add_argument("--flights", type=int, default=500)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    # The pool opens DB_PATH relative to the working directory
+    os.chdir(tmp)
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    build_database(DB_PATH, args.tickets, args.flights)
+    ticket_numbers = [f"{i:013d}" for i in range(args.tickets)]
+    failures = []
+
+    # Phase 1: concurrent rebookings
+    assigned = defaultdict(set)
+    assigned_lock = threading.Lock()
+
+    def rebook_job():
+        ticket_no = random.choice(ticket_numbers)
+        flight_id = random.randint(1, args.flights)
+        result, details = rebook_ticket(ticket_no, flight_id, PASSENGER_ID)
+        if result is WriteResult.OK:
+            with assigned_lock:
+                assigned[ticket_no].add(flight_id)
+        return result, details
+
+    counts = run_phase("rebook", args.workers, [rebook_job] * (args.workers * args.ops))
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute("SELECT ticket_no, flight_id FROM ticket_flights").fetchall()
+    final = dict(rows)
+    if len(rows) != args.tickets or set(final) != set(ticket_numbers):
+        failures.append(f"ticket_flights has {len(rows)} rows for {args.tickets} tickets after rebooking")
+    for ticket_no, flight_id in final.items():
+        if flight_id not in (assigned[ticket_no] or {1}):
+            failures.append(f"ticket {ticket_no} ended on flight {flight_id}, which no successful rebooking assigned")
+    if counts[WriteResult.LOCKED]:
+        failures.append(f"{counts[WriteResult.LOCKED]} rebookings gave up waiting for the write lock")
+
+    # Phase 2: every worker races to cancel every ticket
+    cancel_jobs = [
+        (lambda ticket_no=ticket_no: cancel_ticket_flights(ticket_no, PASSENGER_ID))
+        for ticket_no in ticket_numbers
+        for _ in range(args.workers)
+    ]
+    random.shuffle(cancel_jobs)
+    counts = run_phase("cancel", args.workers, cancel_jobs)
+    if counts[WriteResult.OK] != args.tickets:
+        failures.append(f"{counts[WriteResult.OK]} successful cancellations for {args.tickets} tickets")
+    remaining = conn.execute("SELECT COUNT(*) FROM ticket_flights").fetchone()[0]
+    if remaining:
+        failures.append(f"{remaining} ticket_flights rows left after cancelling every ticket")
+    conn.close()
+
+    print("pool:", pool_stats())
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("OK: no lost or duplicated updates")
+
+
+if __name__ == "__main__":
+    main()
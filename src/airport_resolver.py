@@ -0,0 +1,103 @@
+import json
+import threading
+import unicodedata
+from collections import defaultdict
+
+from src.sqlite_pool import fetch_dicts
+from src.sqlite_queries import AIRPORTS_QUERY
+
+
+def _normalize(text: str) -> str:
+    """Casefold and strip accents so 'Zürich' and 'zurich' compare equal."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).split())
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _localized(value) -> dict:
+    """travel2 stores names as JSON objects keyed by language, e.g. {"en": ..., "ru": ...}."""
+    if isinstance(value, str) and value.startswith("{"):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return {"en": value} if value else {}
+
+
+class AirportIndex:
+    """Trigram index over airport codes and every localized airport and city name."""
+
+    def __init__(self, airports: list[dict]):
+        self.airports = []
+        # Each term is (airport position, normalized text, trigrams)
+        self.terms = []
+        self.postings = defaultdict(set)
+        self.codes = {}
+
+        for row in airports:
+            names = _localized(row.get("airport_name"))
+            cities = _localized(row.get("city"))
+            position = len(self.airports)
+            self.airports.append({
+                "airport_code": row["airport_code"],
+                "airport_name": names.get("en") or next(iter(names.values()), None),
+                "city": cities.get("en") or next(iter(cities.values()), None),
+            })
+            self.codes[row["airport_code"].casefold()] = position
+            for text in {*names.values(), *cities.values(), row["airport_code"]}:
+                if not text:
+                    continue
+                normalized = _normalize(text)
+                grams = _trigrams(normalized)
+                term_id = len(self.terms)
+                self.terms.append((position, normalized, grams))
+                for gram in grams:
+                    self.postings[gram].add(term_id)
+
+    def search(self, query: str, k: int = 5) -> list[dict]:
+        """Return the top-k airports for a code, city or airport name, best first."""
+        normalized = _normalize(query)
+        if not normalized:
+            return []
+        scores = {}
+        if normalized in self.codes:
+            scores[self.codes[normalized]] = 1.0
+
+        query_grams = _trigrams(normalized)
+        candidates = set()
+        for gram in query_grams:
+            candidates |= self.postings.get(gram, set())
+        for term_id in candidates:
+            position, text, grams = self.terms[term_id]
+            score = len(query_grams & grams) / len(query_grams | grams)
+            if normalized in text or text in normalized:
+                # Reward containment, e.g. "zurich" in "zurich airport"
+                score = max(score, 0.9 * min(len(normalized), len(text)) / max(len(normalized), len(text)), 0.6)
+            if score > scores.get(position, 0.0):
+                scores[position] = score
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [{**self.airports[position], "score": round(score, 3)} for position, score in ranked]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def build_airport_index() -> AirportIndex:
+    """(Re)build the index from airports_data. Called once at startup."""
+    global _index
+    _index = AirportIndex(fetch_dicts(AIRPORTS_QUERY))
+    return _index
+
+
+def get_airport_index() -> AirportIndex:
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                build_airport_index()
+    return _index
@@ -0,0 +1,18 @@
+from langchain_openai import AzureChatOpenAI
+
+
+class StreamingUsageAzureChatOpenAI(AzureChatOpenAI):
+    """AzureChatOpenAI that also reports token usage on streamed responses.
+
+    ChatOpenAI has stream_usage=True for this; the Azure class does not, so request the
+    final usage chunk explicitly. It carries the cached prompt token count.
+    """
+
+    def _stream(self, *args, **kwargs):
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        yield from super()._stream(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        kwargs.setdefault("stream_options", {"include_usage": True})
+        async for chunk in super()._astream(*args, **kwargs):
+            yield chunk
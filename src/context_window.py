@@ -0,0 +1,172 @@
+import functools
+import json
+import os
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, ToolMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+# Token budget for everything sent to the assistant: system prompt, user info, summary and history
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+# The latest turns are always kept verbatim, whatever the budget says
+KEEP_RECENT_TURNS = int(os.getenv("CONTEXT_KEEP_RECENT_TURNS", "2"))
+# Tool outputs from earlier turns longer than this are cut down to a short preview
+COLLAPSE_TOOL_OUTPUT_TOKENS = 200
+COLLAPSED_PREVIEW_CHARS = 300
+COLLAPSED_MARKER = "[earlier tool output collapsed"
+# gpt-4o / gpt-4o-mini tokenizer
+TOKEN_ENCODING = "o200k_base"
+# Per-message overhead of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """Update the running summary of a customer support conversation with the turns below.
+Keep ticket numbers, flight ids, airports, dates, the customer's requests and decisions, and any policy conclusions.
+Answer with the summary only, at most 200 words.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}"""
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        # tiktoken downloads the BPE file on first use; without it fall back to an estimate
+        print(f"Token counting falls back to an estimate: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # ~4 characters per token for ASCII text, ~1 per CJK character
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def _content_text(message) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in message.content)
+
+
+def count_message_tokens(messages: list) -> int:
+    total = 0
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + count_tokens(_content_text(message))
+        if isinstance(message, AIMessage) and message.tool_calls:
+            total += count_tokens(json.dumps([tc["args"] for tc in message.tool_calls], default=str))
+    return total
+
+
+def split_turns(messages: list) -> list[list]:
+    """Group messages into turns, each starting at a HumanMessage.
+
+    Tool calls and their ToolMessages always fall in the same turn, so dropping whole
+    turns never leaves half of a pair behind.
+    """
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _collapse(message: ToolMessage):
+    """A copy of an old ToolMessage with only a short preview of its content."""
+    text = _content_text(message)
+    if text.startswith(COLLAPSED_MARKER) or count_tokens(text) <= COLLAPSE_TOOL_OUTPUT_TOKENS:
+        return None
+    content = f"{COLLAPSED_MARKER} from {message.name or 'tool'}, call it again for full details]\n{text[:COLLAPSED_PREVIEW_CHARS]}..."
+    return message.model_copy(update={"content": content})
+
+
+def _transcript(turns: list[list]) -> str:
+    lines = []
+    for message in (m for turn in turns for m in turn):
+        text = _content_text(message)
+        if isinstance(message, AIMessage) and message.tool_calls:
+            calls = ", ".join(f"{tc['name']}({json.dumps(tc['args'], default=str)})" for tc in message.tool_calls)
+            text = f"{text} [calls {calls}]".strip()
+        lines.append(f"{message.type}: {text}")
+    return "\n".join(lines)
+
+
+class ContextWindow:
+    """Keeps the conversation sent to the assistant within CONTEXT_TOKEN_BUDGET.
+
+    Runs once per user turn, before the assistant. It collapses tool outputs from earlier
+    turns, then folds the oldest turns into a rolling summary until the prompt fits.
+    All changes are written back to the graph state.
+    """
+
+    def __init__(self, summarizer: Runnable, system_prompt: str, budget: int = CONTEXT_TOKEN_BUDGET,
+                 keep_recent_turns: int = KEEP_RECENT_TURNS):
+        self.summarizer = summarizer
+        self.system_prompt = system_prompt
+        self.budget = budget
+        self.keep_recent_turns = max(1, keep_recent_turns)
+
+    @functools.cached_property
+    def system_tokens(self) -> int:
+        # Counted on first use: loading the tokenizer may download its BPE file, which must not happen at import
+        return count_tokens(self.system_prompt)
+
+    def _plan(self, state) -> tuple[list, list, list]:
+        """Return (collapsed message updates, turns to summarize, turns kept)."""
+        turns = split_turns(state["messages"])
+        updates = []
+        for turn in turns[:-1]:
+            for i, message in enumerate(turn):
+                if isinstance(message, ToolMessage) and (collapsed := _collapse(message)):
+                    turn[i] = collapsed
+                    updates.append(collapsed)
+
+        fixed = self.system_tokens + count_tokens(str(state.get("user_info") or "")) + count_tokens(state.get("summary") or "")
+        sizes = [count_message_tokens(turn) for turn in turns]
+        dropped = 0
+        while fixed + sum(sizes[dropped:]) > self.budget and len(turns) - dropped > self.keep_recent_turns:
+            dropped += 1
+        return updates, turns[:dropped], turns[dropped:]
+
+    def _update(self, updates, dropped, summary) -> dict:
+        removals = [RemoveMessage(id=m.id) for turn in dropped for m in turn]
+        # Collapsed messages keep their id, so add_messages replaces them in place
+        kept_updates = [m for m in updates if all(m.id != r.id for r in removals)]
+        result = {"messages": removals + kept_updates}
+        if dropped:
+            result["summary"] = summary
+            print(f"Context window: summarized {len(dropped)} earlier turn(s)")
+        return result
+
+    def _summary_input(self, state, dropped) -> str:
+        return SUMMARY_PROMPT.format(summary=state.get("summary") or "(none)", turns=_transcript(dropped))
+
+    def __call__(self, state, config: RunnableConfig):
+        updates, dropped, _ = self._plan(state)
+        summary = state.get("summary")
+        if dropped:
+            summary = _content_text(self.summarizer.invoke(self._summary_input(state, dropped), config))
+        return self._update(updates, dropped, summary)
+
+    async def acall(self, state, config: RunnableConfig):
+        updates, dropped, _ = self._plan(state)
+        summary = state.get("summary")
+        if dropped:
+            summary = _content_text(await self.summarizer.ainvoke(self._summary_input(state, dropped), config))
+        return self._update(updates, dropped, summary)
+
+    def prompt_tokens(self, state) -> int:
+        """Estimated prompt size of an assistant call on this state."""
+        return (
+            self.system_tokens
+            + count_tokens(str(state.get("user_info") or ""))
+            + count_tokens(state.get("summary") or "")
+            + count_message_tokens(state["messages"])
+        )
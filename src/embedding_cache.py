@@ -0,0 +1,145 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.sqlite_pool import SAVE_DIR
+
+# Query embeddings are deterministic for a given model, so the cache is on by default (EMBEDDING_CACHE=0 disables it)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE", "1").lower() not in ("0", "false", "no")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(SAVE_DIR, "embedding_cache.sqlite"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "5000"))
+
+
+def normalize_query(text: str) -> str:
+    """Case, width and whitespace variants of a query share one cache entry."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return re.sub(r"\s+", " ", text).strip(" ?!.。？！")
+
+
+def model_id(embeddings: Embeddings) -> str:
+    """Everything about the embedding model that changes its vectors."""
+    if isinstance(embeddings, CachedQueryEmbeddings):
+        return embeddings.model
+    parts = [type(embeddings).__name__]
+    for field in ("model", "deployment", "dimensions"):
+        value = getattr(embeddings, field, None)
+        if value is not None:
+            parts.append(f"{field}={value}")
+    return ";".join(parts)
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper that keeps query vectors in a local SQLite file.
+
+    Only embed_query / aembed_query are cached; documents are embedded once at ingestion
+    and go straight to the wrapped model. Entries are keyed by the model and the
+    normalized query text, and the least recently used ones are evicted beyond
+    EMBEDDING_CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, embeddings: Embeddings, path: str = EMBEDDING_CACHE_PATH,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.embeddings = embeddings
+        self.model = model_id(embeddings)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "remote_seconds": 0.0}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                text TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embedding_cache_last_used ON embedding_cache (last_used_at)"
+        )
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM embedding_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE embedding_cache SET last_used_at = ? WHERE key = ?", (time.time(), key))
+            self._stats["hits"] += 1
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def _store(self, key: str, text: str, vector: list[float], seconds: float):
+        now = time.time()
+        with self._lock:
+            self._stats["remote_seconds"] += seconds
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embedding_cache (key, model, text, vector, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                (key, self.model, normalize_query(text), np.asarray(vector, dtype=np.float32).tobytes(), now),
+            )
+            self._stats["evictions"] += self._conn.execute(
+                """
+                DELETE FROM embedding_cache WHERE key IN (
+                    SELECT key FROM embedding_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            ).rowcount
+
+    def embed_query(self, text: str) -> list[float]:
+        key = self._key(text)
+        vector = self._lookup(key)
+        if vector is None:
+            started = time.perf_counter()
+            vector = self.embeddings.embed_query(text)
+            self._store(key, text, vector, time.perf_counter() - started)
+        return vector
+
+    async def aembed_query(self, text: str) -> list[float]:
+        key = self._key(text)
+        vector = self._lookup(key)
+        if vector is None:
+            started = time.perf_counter()
+            vector = await self.embeddings.aembed_query(text)
+            self._store(key, text, vector, time.perf_counter() - started)
+        return vector
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embedding_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+            hits, misses = self._stats["hits"], self._stats["misses"]
+            remote_avg = self._stats["remote_seconds"] / misses if misses else 0.0
+            return {
+                **self._stats,
+                "remote_seconds": round(self._stats["remote_seconds"], 3),
+                "entries": entries,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                # Each hit skipped one remote call of average duration
+                "estimated_saved_seconds": round(hits * remote_avg, 3),
+            }
+
+
+def cached_query_embeddings(embeddings: Embeddings) -> Embeddings:
+    """`embeddings` behind the query cache, or unchanged when EMBEDDING_CACHE=0."""
+    return CachedQueryEmbeddings(embeddings) if EMBEDDING_CACHE_ENABLED else embeddings
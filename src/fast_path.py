@@ -0,0 +1,157 @@
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+
+from src.itinerary_cache import get_itinerary
+from src.itinerary_format import parse_time, utc_offset
+
+# Questions answered from the cached itinerary without calling the LLM. Each pattern must
+# match the whole message, so anything longer or different ("... and can I change it?")
+# falls through to the assistant.
+_GREETING_EN = r"(?:(?:hi|hello|hey)(?: there)?[\s,!.]*)?"
+_GREETING_ZH = r"(?:(?:你好|您好|哈囉|hi|hello)[\s,，!！]*)?"
+_END = r"[\s?？!！.。]*"
+INTENT_PATTERNS = {
+    "next_flight": [
+        _GREETING_EN + r"(?:what time|when) (?:is|does) my (?:next |upcoming )?flight(?: (?:leave|depart|take off))?" + _END,
+        _GREETING_ZH + r"我(?:的|嘅)?(?:最新|下一班|下班|最近|下一個)?(?:的|嘅)?(?:航班|班機|機)(?:係|是)?"
+                       r"(?:幾時|幾點|什麼時候|甚麼時候|何時|咩時間)(?:起飛|出發|飛)?(?:呀|啊|嗎)?" + _END,
+    ],
+    "seat": [
+        _GREETING_EN + r"what(?:'s| is) my seat(?: number)?" + _END,
+        _GREETING_ZH + r"我(?:的|嘅)?座位(?:號碼|號)?(?:係|是)?(?:幾多號|幾號|咩|什麼|甚麼|邊個|哪個)?(?:呀|啊)?" + _END,
+    ],
+    "my_flights": [
+        _GREETING_EN + r"(?:(?:show|list)(?: me)? my (?:flights|bookings|tickets)|what flights do i have)" + _END,
+        _GREETING_ZH + r"(?:我(?:有)?(?:咩|什麼|甚麼|哪些|邊啲)航班|我(?:的|嘅)(?:航班|機票)(?:資料|資訊|詳情)?)(?:呀|啊)?" + _END,
+    ],
+}
+_COMPILED = {
+    intent: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+    for intent, patterns in INTENT_PATTERNS.items()
+}
+_CJK = re.compile(r"[㐀-鿿]")
+
+_stats = {"lookups": 0, "hits": 0, "fast_seconds": 0.0, "llm_turns": 0, "llm_seconds": 0.0}
+_hits_by_intent = {}
+_lock = threading.Lock()
+
+
+def match_intent(text: str):
+    """The itinerary intent the whole message asks for, or None."""
+    text = text.strip()
+    for intent, patterns in _COMPILED.items():
+        if any(pattern.fullmatch(text) for pattern in patterns):
+            return intent
+    return None
+
+
+def _upcoming(rows: list[dict]) -> list[dict]:
+    now = datetime.now(timezone.utc)
+    flights = []
+    for row in rows:
+        departure = parse_time(row.get("scheduled_departure"))
+        if departure and departure.tzinfo and departure > now:
+            flights.append((departure, row))
+    return [row for _, row in sorted(flights, key=lambda item: item[0])]
+
+
+def _when(value) -> str:
+    moment = parse_time(value)
+    return f"{moment:%Y-%m-%d %H:%M} ({utc_offset(moment)})" if moment else "-"
+
+
+def _answer(intent: str, flights: list[dict], chinese: bool) -> str:
+    flight = flights[0]
+    details = {
+        "flight": flight["flight_no"],
+        "origin": flight["departure_airport"],
+        "destination": flight["arrival_airport"],
+        "departs": _when(flight["scheduled_departure"]),
+        "arrives": _when(flight["scheduled_arrival"]),
+        "ticket": flight["ticket_no"],
+        "seat": flight.get("seat_no"),
+    }
+    if intent == "next_flight":
+        english = ("Your next flight is {flight} from {origin} to {destination}, departing {departs} "
+                   "and arriving {destination} at {arrives} (ticket {ticket}).").format(**details)
+        cantonese = "你下一班航班係 {flight}，由 {origin} 飛 {destination}，{departs} 起飛，{arrives} 到達（機票 {ticket}）。".format(**details)
+    elif intent == "seat":
+        if details["seat"]:
+            english = "Your seat on flight {flight} ({departs}) is {seat}.".format(**details)
+            cantonese = "你喺航班 {flight}（{departs}）嘅座位係 {seat}。".format(**details)
+        else:
+            english = "No seat has been assigned yet on your next flight {flight} ({departs}).".format(**details)
+            cantonese = "你下一班航班 {flight}（{departs}）暫時未有座位編排。".format(**details)
+    else:
+        english = "Your upcoming flights:\n" + "\n".join(
+            f"- {row['flight_no']} {row['departure_airport']} → {row['arrival_airport']}, departs {_when(row['scheduled_departure'])}"
+            f" (ticket {row['ticket_no']}{', seat ' + row['seat_no'] if row.get('seat_no') else ''})"
+            for row in flights
+        )
+        cantonese = "你之後嘅航班：\n" + "\n".join(
+            f"- {row['flight_no']} {row['departure_airport']} → {row['arrival_airport']}，{_when(row['scheduled_departure'])} 起飛"
+            f"（機票 {row['ticket_no']}{'，座位 ' + row['seat_no'] if row.get('seat_no') else ''}）"
+            for row in flights
+        )
+    # Same convention as the assistant: answer in the user's language, with a Cantonese translation
+    return cantonese if chinese else f"{english}\n\n({cantonese})"
+
+
+def fast_path(state, config: RunnableConfig):
+    """Answer a plain itinerary question from the cached itinerary, or leave the turn to the assistant."""
+    message = state["messages"][-1]
+    if not isinstance(message, HumanMessage) or not isinstance(message.content, str):
+        return {}
+    started = time.perf_counter()
+    intent = match_intent(message.content)
+    passenger_id = config.get("configurable", {}).get("passenger_id")
+    flights = _upcoming(get_itinerary(passenger_id)) if intent and passenger_id else []
+    with _lock:
+        _stats["lookups"] += 1
+    if not flights:
+        # No confident match, or nothing upcoming to answer with
+        return {}
+
+    content = _answer(intent, flights, chinese=bool(_CJK.search(message.content)))
+    elapsed = time.perf_counter() - started
+    with _lock:
+        _stats["hits"] += 1
+        _stats["fast_seconds"] += elapsed
+        _hits_by_intent[intent] = _hits_by_intent.get(intent, 0) + 1
+    print(f"Fast path answered '{intent}' in {elapsed * 1000:.1f} ms")
+    return {"messages": AIMessage(content=content, response_metadata={"fast_path": intent})}
+
+
+def answered_by_fast_path(state) -> bool:
+    """True when fast_path has answered the turn."""
+    message = state["messages"][-1]
+    return isinstance(message, AIMessage) and "fast_path" in message.response_metadata
+
+
+def record_llm_turn(seconds: float):
+    """Assistant LLM latency, used to estimate the time the fast path saves."""
+    with _lock:
+        _stats["llm_turns"] += 1
+        _stats["llm_seconds"] += seconds
+
+
+def fast_path_stats() -> dict:
+    with _lock:
+        hits, lookups = _stats["hits"], _stats["lookups"]
+        fast_avg = _stats["fast_seconds"] / hits if hits else 0.0
+        llm_avg = _stats["llm_seconds"] / _stats["llm_turns"] if _stats["llm_turns"] else None
+        return {
+            "lookups": lookups,
+            "hits": hits,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "hits_by_intent": dict(_hits_by_intent),
+            "avg_fast_ms": round(fast_avg * 1000, 2),
+            "avg_llm_call_ms": round(llm_avg * 1000, 1) if llm_avg is not None else None,
+            # Each hit skipped at least one assistant LLM call
+            "estimated_saved_s": round(hits * (llm_avg - fast_avg), 2) if llm_avg is not None else None,
+        }
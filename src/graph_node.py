@@ -1,64 +1,143 @@
 import os
+import time
+import functools
 from dotenv import load_dotenv
 from datetime import datetime
 from typing import Annotated
 
-from langchain_core.messages import ToolMessage
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage
 from typing_extensions import TypedDict
 from langgraph.graph.message import AnyMessage, add_messages
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import Runnable, RunnableConfig
-from langchain_openai import ChatOpenAI, AzureChatOpenAI
-from src.prompt import SYSTEM_PROMPT
-from src.sqlite_tools import fetch_user_flight_information, get_airport_code, search_flights, update_ticket_to_new_flight, cancel_ticket
-from src.vector_store_retriever import lookup_policy
-from src.tools import create_tool_node_with_fallback, _print_event
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+from src.context_window import ContextWindow
+from src.fast_path import answered_by_fast_path, fast_path, record_llm_turn
+from src.itinerary_format import format_itinerary
+from src.llm_cache import get_llm_cache
+from src.policy_prefetch import POLICY_PREFETCH_ENABLED
+from src.prompt import SYSTEM_PROMPT, CONTEXT_PROMPT
+from src.sqlite_tools import fetch_user_flight_information, resolve_airport, search_flights, update_ticket_to_new_flight, cancel_ticket
+from src.vector_store_retriever import lookup_policy, policy_prefetcher
+from src.tools import ToolOutputPolicy, create_partial_tool_node, pending_tool_calls, _print_event
 # gmail_toolkit, list_calendar_events, create_calendar_event, update_calendar_event, \
 
 
 # Load environment variables
 load_dotenv()
 
+# Upper bound on safe tool calls from one AIMessage that run at the same time
+MAX_PARALLEL_TOOL_CALLS = int(os.getenv("MAX_PARALLEL_TOOL_CALLS", "4"))
+
 class State(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
     user_info: str
+    # Rolling summary of the turns the context window has dropped
+    summary: str
+    # Prompt size of the latest assistant call, and how much of it the provider served from its prompt cache
+    prompt_tokens: int
+    cached_prompt_tokens: int
 
 
 class Assistant:
-    def __init__(self, runnable: Runnable):
+    def __init__(self, runnable: Runnable, count_prompt_tokens=None):
         self.runnable = runnable
+        self.count_prompt_tokens = count_prompt_tokens
+
+    @staticmethod
+    def _with_summary(state: State) -> State:
+        if not state.get("summary"):
+            return state
+        summary = SystemMessage(content=f"Summary of the earlier conversation:\n{state['summary']}")
+        return {**state, "messages": [summary] + state["messages"]}
+
+    def _result(self, state: State, result) -> dict:
+        if result.response_metadata.get("cache_hit"):
+            # Replayed from the response cache: its usage was paid for by the original call
+            return {"messages": result}
+        if result.usage_metadata:
+            cached = result.usage_metadata.get("input_token_details", {}).get("cache_read", 0)
+            return {
+                "messages": result,
+                "prompt_tokens": result.usage_metadata["input_tokens"],
+                "cached_prompt_tokens": cached,
+            }
+        if self.count_prompt_tokens:
+            # An estimate says nothing about the provider cache; don't leave the previous turn's count next to it
+            return {"messages": result, "prompt_tokens": self.count_prompt_tokens(state), "cached_prompt_tokens": 0}
+        return {"messages": result}
+
+    @staticmethod
+    def _is_empty(result) -> bool:
+        return not result.tool_calls and (
+            not result.content
+            or isinstance(result.content, list)
+            and not result.content[0].get("text")
+        )
 
     def __call__(self, state: State, config: RunnableConfig):
+        # prompt_tokens already counts the summary, so it is given the state without the summary message
+        original = state
+        state = self._with_summary(state)
+        started = time.perf_counter()
         while True:
-            result = self.runnable.invoke(state)
+            result = self.runnable.invoke(state, config)
             # If the LLM happens to return an empty response, we will re-prompt it
             # for an actual response.
-            if not result.tool_calls and (
-                not result.content
-                or isinstance(result.content, list)
-                and not result.content[0].get("text")
-            ):
+            if self._is_empty(result):
                 messages = state["messages"] + [("user", "Respond with a real output.")]
                 state = {**state, "messages": messages}
             else:
                 break
-        return {"messages": result}
+        record_llm_turn(time.perf_counter() - started)
+        return self._result(original, result)
 
+    async def acall(self, state: State, config: RunnableConfig):
+        original = state
+        state = self._with_summary(state)
+        started = time.perf_counter()
+        while True:
+            result = await self.runnable.ainvoke(state, config)
+            if self._is_empty(result):
+                messages = state["messages"] + [("user", "Respond with a real output.")]
+                state = {**state, "messages": messages}
+            else:
+                break
+        record_llm_turn(time.perf_counter() - started)
+        return self._result(original, result)
 
-# llm = ChatOpenAI(model="gpt-4o-mini")
 
-llm = AzureChatOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    azure_deployment="gpt-4o-mini",  # or your deployment
-    api_version="2025-01-01-preview",  # or your api version
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
+# The Azure client (and langchain_openai/openai behind it) is built on the first assistant call, not at import
+@functools.lru_cache(maxsize=1)
+def get_llm():
+    from src.chat_models import StreamingUsageAzureChatOpenAI
+
+    # return ChatOpenAI(model="gpt-4o-mini")
+    return StreamingUsageAzureChatOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        azure_deployment="gpt-4o-mini",  # or your deployment
+        api_version="2025-01-01-preview",  # or your api version
+        temperature=0,
+        max_tokens=None,
+        timeout=None,
+        max_retries=2,
+        # Opt-in exact-match response cache (LLM_CACHE=1); None when disabled
+        cache=get_llm_cache(),
+    )
+
+
+# A RunnableLambda that returns a runnable is invoked (or streamed) with the same input and config,
+# so this stands in for the model in chains without creating it
+llm = RunnableLambda(lambda _: get_llm(), name="llm")
 
 
+def current_minute():
+    # Minute resolution keeps the prompt identical across quick repeated turns, so they can hit the response cache
+    return datetime.now().replace(second=0, microsecond=0)
+
+
+# Static system prompt first, then the (append-only) conversation, then the per-turn context.
+# Together with the tool schemas this keeps the longest possible prefix identical between calls.
 assistant_prompt = ChatPromptTemplate.from_messages(
     [
         (
@@ -66,14 +145,15 @@ assistant_prompt = ChatPromptTemplate.from_messages(
             SYSTEM_PROMPT,
         ),
         ("placeholder", "{messages}"),
+        ("system", CONTEXT_PROMPT),
     ]
-).partial(time=datetime.now)
+).partial(time=current_minute)
 
 
 # "Read"-only tools (such as retrievers) don't need a user confirmation to use
 part_3_safe_tools = [
     fetch_user_flight_information,
-    get_airport_code,
+    resolve_airport,
     search_flights,
     lookup_policy,
 ]
@@ -87,10 +167,22 @@ part_3_sensitive_tools = ([
 # + gmail_toolkit + [create_calendar_event, update_calendar_event])
 
 sensitive_tool_names = {t.name for t in part_3_sensitive_tools}
+
+# Tool outputs stay in the conversation and are re-sent on every later call, so keep them lean.
+# search_flights sizes its own pages (SEARCH_FLIGHTS_OUTPUT) so that next_page_token follows the last
+# flight shown, and resolve_airport is bounded by its k. fetch_user_flight_information is sent whole:
+# it takes no query, so the model could never get back bookings dropped before a rebook or cancel.
+TOOL_OUTPUT_POLICIES = {
+    # Four ~1000 character policy chunks
+    "lookup_policy": ToolOutputPolicy(max_tokens=1000),
+}
 # Our LLM doesn't have to know which nodes it has to route to. In its 'mind', it's just invoking functions.
-part_3_assistant_runnable = assistant_prompt | llm.bind_tools(
-    part_3_safe_tools + part_3_sensitive_tools
-)
+@functools.lru_cache(maxsize=1)
+def get_assistant_llm():
+    return get_llm().bind_tools(part_3_safe_tools + part_3_sensitive_tools)
+
+
+part_3_assistant_runnable = assistant_prompt | RunnableLambda(lambda _: get_assistant_llm(), name="assistant_llm")
 
 
 from typing import Literal
@@ -101,21 +193,62 @@ from langgraph.prebuilt import tools_condition
 
 builder = StateGraph(State)
 
+# The itinerary goes into every assistant prompt, so it is sent in the compact table form
 def user_info(state: State):
-    return {"user_info": fetch_user_flight_information.invoke({})}
+    return {"user_info": format_itinerary(fetch_user_flight_information.invoke({}))}
+
+
+async def auser_info(state: State):
+    return {"user_info": format_itinerary(await fetch_user_flight_information.ainvoke({}))}
 
 
 # NEW: The fetch_user_info node runs first, meaning our assistant can see the user's flight information without
 # having to take an action
-builder.add_node("fetch_user_info", user_info)
+builder.add_node("fetch_user_info", RunnableLambda(user_info, afunc=auser_info))
 builder.add_edge(START, "fetch_user_info")
-builder.add_node("assistant", Assistant(part_3_assistant_runnable))
-builder.add_node("safe_tools", create_tool_node_with_fallback(part_3_safe_tools))
-builder.add_node(
-    "sensitive_tools", create_tool_node_with_fallback(part_3_sensitive_tools)
-)
+# Plain itinerary questions ("when is my flight?") are answered from the cached itinerary, skipping the LLM
+builder.add_node("fast_path", fast_path)
+
+
+# The system prompt has the assistant consult the policies first, so most turns go LLM call, policy search,
+# LLM call. Start the search on the user's own words now; lookup_policy uses it if its query is similar.
+def prefetch_policy(state: State, config: RunnableConfig):
+    message = state["messages"][-1]
+    if POLICY_PREFETCH_ENABLED and isinstance(message, HumanMessage) and isinstance(message.content, str):
+        policy_prefetcher.start(config.get("configurable", {}).get("thread_id"), message.content)
+    return {}
+
+
+builder.add_node("prefetch_policy", prefetch_policy)
+# Once per user turn, trim the history to the token budget before the assistant sees it
+context_window = ContextWindow(llm, SYSTEM_PROMPT)
+builder.add_node("manage_context", RunnableLambda(context_window, afunc=context_window.acall))
+assistant = Assistant(part_3_assistant_runnable, context_window.prompt_tokens)
+# Both nodes have native async variants, so graph.ainvoke/astream never block the event loop
+builder.add_node("assistant", RunnableLambda(assistant, afunc=assistant.acall))
+# One AIMessage may mix safe and sensitive calls. The safe ones run first, all at once;
+# only the sensitive ones are left for the interrupt_before gate on sensitive_tools.
+builder.add_node("safe_tools", create_partial_tool_node(
+    part_3_safe_tools,
+    lambda messages: pending_tool_calls(messages, exclude=sensitive_tool_names),
+    max_concurrency=MAX_PARALLEL_TOOL_CALLS,
+    output_policies=TOOL_OUTPUT_POLICIES,
+))
+builder.add_node("sensitive_tools", create_partial_tool_node(
+    part_3_sensitive_tools,
+    lambda messages: pending_tool_calls(messages, include=sensitive_tool_names),
+    output_policies=TOOL_OUTPUT_POLICIES,
+))
 # Define logic
-builder.add_edge("fetch_user_info", "assistant")
+builder.add_edge("fetch_user_info", "fast_path")
+builder.add_edge("prefetch_policy", "manage_context")
+builder.add_edge("manage_context", "assistant")
+
+
+def route_fast_path(state: State):
+    if answered_by_fast_path(state):
+        return END
+    return "prefetch_policy"
 
 
 def route_tools(state: State):
@@ -124,16 +257,25 @@ def route_tools(state: State):
     if next_node == END:
         return END
     ai_message = state["messages"][-1]
-    # This assumes single tool calls. To handle parallel tool calling, you'd want to
-    # use an ANY condition
-    first_tool_call = ai_message.tool_calls[0]
-    if first_tool_call["name"] in sensitive_tool_names:
+    # Unknown tool names also go to safe_tools, which answers them with an error message
+    if any(tc["name"] not in sensitive_tool_names for tc in ai_message.tool_calls):
+        return "safe_tools"
+    return "sensitive_tools"
+
+
+def route_after_safe_tools(state: State):
+    if pending_tool_calls(state["messages"], include=sensitive_tool_names):
         return "sensitive_tools"
-    return "safe_tools"
+    return "assistant"
 
 
+builder.add_conditional_edges(
+    "fast_path", route_fast_path, ["prefetch_policy", END]
+)
 builder.add_conditional_edges(
     "assistant", route_tools, ["safe_tools", "sensitive_tools", END]
 )
-builder.add_edge("safe_tools", "assistant")
+builder.add_conditional_edges(
+    "safe_tools", route_after_safe_tools, ["sensitive_tools", "assistant"]
+)
 builder.add_edge("sensitive_tools", "assistant")
\ No newline at end of file
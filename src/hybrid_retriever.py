@@ -0,0 +1,147 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from src.policy_prefetch import STOPWORDS
+
+# "hybrid": BM25 and vector search fused, skipping the embedding when BM25 is confident;
+# "vector" or "lexical" use one side only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Share of the query's (idf-weighted) terms the best BM25 chunk must contain to answer without embedding
+LEXICAL_CONFIDENCE = float(os.getenv("LEXICAL_CONFIDENCE", "0.9"))
+# Candidates taken from each side before fusion, and the reciprocal rank fusion constant
+FUSION_CANDIDATES = 10
+RRF_K = 60
+
+_TOKEN = re.compile(r"[a-z0-9]+|[㐀-鿿]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased words without stopwords and plural 's', and character bigrams for CJK runs."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token[0].isascii():
+            if token not in STOPWORDS:
+                tokens.append(token[:-1] if len(token) > 3 and token.endswith("s") else token)
+        elif len(token) == 1:
+            tokens.append(token)
+        else:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of texts, with an inverted index of term frequencies."""
+
+    def __init__(self, texts: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = []
+        for i, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((i, tf))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def idf(self, term: str) -> float:
+        # Terms outside the corpus get the idf of the rarest possible term
+        df = len(self.postings.get(term, ()))
+        n = len(self.lengths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k: int) -> tuple[list[tuple[int, float]], float]:
+        """The k best (chunk index, score) pairs, and the idf-weighted share of query terms in the best chunk."""
+        terms = set(tokenize(query))
+        scores = {}
+        for term in terms:
+            idf = self.idf(term)
+            for i, tf in self.postings.get(term, ()):
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.average_length)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        if not ranked:
+            return [], 0.0
+        best = ranked[0][0]
+        matched = sum(self.idf(t) for t in terms if any(i == best for i, _ in self.postings.get(t, ())))
+        return ranked, matched / sum(self.idf(t) for t in terms)
+
+
+class HybridRetriever:
+    """Policy search combining BM25 over the chunks with the vector store.
+
+    When the best BM25 chunk contains (nearly) every query term, the BM25 ranking is
+    returned and no embedding is requested. Otherwise both rankings are combined with
+    reciprocal rank fusion, which only needs the order of each side, so it works the same
+    with Chroma distances and NumPy cosine scores; the BM25 side is weighted by its term
+    coverage. Chunks are matched by their text.
+    """
+
+    def __init__(self, chunks: list, vectordb, mode: str = RETRIEVAL_MODE, confidence: float = LEXICAL_CONFIDENCE):
+        if mode not in ("hybrid", "vector", "lexical"):
+            raise ValueError(f"Unknown RETRIEVAL_MODE {mode!r}, expected 'hybrid', 'vector' or 'lexical'")
+        self.chunks = chunks
+        self.vectordb = vectordb
+        self.mode = mode
+        self.confidence = confidence
+        self.index = BM25Index([chunk.page_content for chunk in chunks])
+        self._lock = threading.Lock()
+        self._stats = {"searches": 0, "lexical_only": 0, "fused": 0, "vector_only": 0}
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self._stats["searches"] += 1
+            self._stats[outcome] += 1
+
+    def _lexical(self, query: str, k: int):
+        """(BM25 ranking, share of the query terms in its best chunk, whether it can be used alone)."""
+        if self.mode == "vector":
+            return [], 0.0, False
+        ranked, coverage = self.index.search(query, max(k, FUSION_CANDIDATES))
+        confident = self.mode == "lexical" or (bool(ranked) and coverage >= self.confidence)
+        return [self.chunks[i] for i, _ in ranked], coverage, confident
+
+    def _fuse(self, lexical: list, coverage: float, vector: list, k: int) -> list:
+        if not lexical:
+            self._count("vector_only")
+            return vector[:k]
+        self._count("fused")
+        scores, docs = {}, {}
+        # A BM25 ranking built on a few matching terms (e.g. a typo in the rest) counts for less
+        for ranking, weight in ((lexical, coverage), (vector, 1.0)):
+            for rank, doc in enumerate(ranking):
+                docs.setdefault(doc.page_content, doc)
+                scores[doc.page_content] = scores.get(doc.page_content, 0.0) + weight / (RRF_K + rank + 1)
+        best = sorted(scores, key=lambda text: -scores[text])[:k]
+        return [docs[text] for text in best]
+
+    def search(self, query: str, k: int = 4) -> list:
+        lexical, coverage, confident = self._lexical(query, k)
+        if confident:
+            self._count("lexical_only")
+            return lexical[:k]
+        vector = self.vectordb.similarity_search(query, k=max(k, FUSION_CANDIDATES))
+        return self._fuse(lexical, coverage, vector, k)
+
+    async def asearch(self, query: str, k: int = 4) -> list:
+        # BM25 is a few dictionary lookups, fine to run on the event loop
+        lexical, coverage, confident = self._lexical(query, k)
+        if confident:
+            self._count("lexical_only")
+            return lexical[:k]
+        query_embedding = await self.vectordb.embeddings.aembed_query(query)
+        vector = await self.vectordb.asimilarity_search_by_vector(query_embedding, k=max(k, FUSION_CANDIDATES))
+        return self._fuse(lexical, coverage, vector, k)
+
+    def stats(self) -> dict:
+        with self._lock:
+            searches = self._stats["searches"]
+            return {
+                **self._stats,
+                "mode": self.mode,
+                "chunks": len(self.chunks),
+                "embedding_skipped_rate": self._stats["lexical_only"] / searches if searches else 0.0,
+            }
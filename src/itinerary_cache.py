@@ -0,0 +1,59 @@
+import threading
+
+from src.sqlite_pool import fetch_dicts
+from src.sqlite_queries import USER_FLIGHTS_QUERY
+
+# passenger_id -> itinerary rows, as returned by USER_FLIGHTS_QUERY
+_itineraries = {}
+# Bumped on every invalidation so a read racing with a write never stores stale rows
+_versions = {}
+_epoch = 0
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+
+def get_itinerary(passenger_id: str) -> list[dict]:
+    """Return the passenger's ticket/flight/seat rows, from the cache when possible."""
+    with _lock:
+        cached = _itineraries.get(passenger_id)
+        if cached is not None:
+            _stats["hits"] += 1
+            return [dict(row) for row in cached]
+        _stats["misses"] += 1
+        version = (_epoch, _versions.get(passenger_id, 0))
+
+    rows = fetch_dicts(USER_FLIGHTS_QUERY, (passenger_id,))
+
+    with _lock:
+        if version == (_epoch, _versions.get(passenger_id, 0)):
+            _itineraries[passenger_id] = rows
+    return [dict(row) for row in rows]
+
+
+def invalidate_itinerary(passenger_id: str):
+    """Drop one passenger's cached itinerary after their tickets change."""
+    with _lock:
+        _itineraries.pop(passenger_id, None)
+        _versions[passenger_id] = _versions.get(passenger_id, 0) + 1
+        _stats["invalidations"] += 1
+
+
+def clear_itineraries():
+    """Drop every cached itinerary, e.g. after the database is reset."""
+    global _epoch
+    with _lock:
+        _itineraries.clear()
+        _versions.clear()
+        _epoch += 1
+        _stats["invalidations"] += 1
+
+
+def itinerary_cache_stats() -> dict:
+    """Hit/miss counters of the itinerary cache since startup."""
+    with _lock:
+        lookups = _stats["hits"] + _stats["misses"]
+        return {
+            **_stats,
+            "cached_passengers": len(_itineraries),
+            "hit_rate": _stats["hits"] / lookups if lookups else 0.0,
+        }
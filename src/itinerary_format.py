@@ -0,0 +1,77 @@
+from datetime import datetime
+
+# Fields fetch_user_flight_information copies into every row; written once above the table
+PASSENGER_FIELDS = ("name", "email")
+# Column order and short headers of the ticket table
+COLUMNS = {
+    "ticket_no": "ticket",
+    "book_ref": "booking",
+    "flight_id": "flight_id",
+    "flight_no": "flight",
+    "departure_airport": "from",
+    "arrival_airport": "to",
+    "scheduled_departure": "departs",
+    "scheduled_arrival": "arrives",
+    "seat_no": "seat",
+    "fare_conditions": "class",
+}
+TIME_COLUMNS = {"scheduled_departure", "scheduled_arrival"}
+
+
+def parse_time(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def utc_offset(moment: datetime) -> str:
+    text = moment.strftime("%z")
+    return f"UTC{text[:3]}:{text[3:]}" if text else ""
+
+
+def format_itinerary(rows: list[dict]) -> str:
+    """Compact text form of the rows returned by fetch_user_flight_information.
+
+    Passenger fields are written once, columns that are empty in every row are left
+    out, times are cut to minutes (with a shared UTC offset hoisted into the header),
+    and the tickets are written as a '|'-separated table.
+    """
+    if not rows:
+        return "No tickets."
+
+    lines = []
+    passenger = {field: rows[0].get(field) for field in PASSENGER_FIELDS if rows[0].get(field)}
+    if passenger:
+        lines.append("Passenger: " + ", ".join(f"{field}={value}" for field, value in passenger.items()))
+
+    columns = [column for column in COLUMNS if any(row.get(column) is not None for row in rows)]
+    if not columns:
+        # Only the passenger fields, as returned for a passenger without tickets
+        lines.append("No tickets.")
+        return "\n".join(lines)
+
+    times = {
+        id(row): {column: parse_time(row.get(column)) for column in TIME_COLUMNS}
+        for row in rows
+    }
+    offsets = {utc_offset(moment) for parsed in times.values() for moment in parsed.values() if moment}
+    shared_offset = offsets.pop() if len(offsets) == 1 else None
+
+    def cell(row, column):
+        value = row.get(column)
+        if value is None:
+            return ""
+        if column in TIME_COLUMNS and (moment := times[id(row)][column]):
+            text = moment.strftime("%Y-%m-%d %H:%M")
+            return text if shared_offset is not None else f"{text} {utc_offset(moment)}".rstrip()
+        return str(value)
+
+    header = f"Tickets ({len(rows)})"
+    if shared_offset:
+        header += f", times in {shared_offset}"
+    lines.append(header + ":")
+    lines.append("|".join(COLUMNS[column] for column in columns))
+    for row in rows:
+        lines.append("|".join(cell(row, column) for column in columns))
+    return "\n".join(lines)
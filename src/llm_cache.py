@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumpd, load
+
+from src.sqlite_pool import SAVE_DIR
+
+# Opt-in: set LLM_CACHE=1 to answer repeated identical assistant calls from disk
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(SAVE_DIR, "llm_cache.sqlite"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+
+# Message fields that differ between otherwise identical prompts
+VOLATILE_FIELDS = {"id", "response_metadata", "usage_metadata"}
+
+
+def _canonical(value, aliases: dict, in_tool_calls: bool = False):
+    """Drop volatile fields and rename tool call ids in order of appearance."""
+    if isinstance(value, list):
+        return [_canonical(item, aliases, in_tool_calls) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if value.get("lc") == 1 and "kwargs" in value:
+        # A serialized langchain object: its top-level "id" is the class path, keep it
+        kwargs = {k: v for k, v in value["kwargs"].items() if k not in VOLATILE_FIELDS}
+        return {**value, "kwargs": _canonical(kwargs, aliases)}
+    result = {}
+    for key, item in value.items():
+        if key == "tool_call_id" or (key == "id" and in_tool_calls):
+            result[key] = aliases.setdefault(item, f"call_{len(aliases)}")
+        else:
+            result[key] = _canonical(item, aliases, key == "tool_calls")
+    return result
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """sha256 over the prompt messages and the model settings (deployment, params, tool schemas)."""
+    try:
+        prompt = json.dumps(_canonical(json.loads(prompt), {}), sort_keys=True, ensure_ascii=False)
+    except ValueError:
+        pass
+    return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class SQLiteResponseCache(BaseCache):
+    """Exact-match cache of chat model responses in its own SQLite file.
+
+    Entries expire LLM_CACHE_TTL_SECONDS after they were written, and the least
+    recently used ones are evicted beyond LLM_CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used_at)")
+
+    def lookup(self, prompt: str, llm_string: str):
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_used_at = ? WHERE key = ?", (now, key))
+            self._stats["hits"] += 1
+        generations = [load(generation) for generation in json.loads(row[0])]
+        for generation in generations:
+            generation.message.response_metadata = {**generation.message.response_metadata, "cache_hit": True}
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val):
+        stored = []
+        for generation in return_val:
+            serialized = dumpd(generation)
+            # Without an id the replayed message gets a fresh one instead of replacing the original in the graph state
+            serialized["kwargs"]["message"]["kwargs"].pop("id", None)
+            stored.append(serialized)
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(stored), now, now),
+            )
+            self._stats["writes"] += 1
+            self._evict(now)
+
+    def _evict(self, now: float):
+        expired = self._conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        over = self._conn.execute(
+            """
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        ).rowcount
+        self._stats["evictions"] += expired + over
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": entries,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+
+_cache = None
+
+
+def get_llm_cache():
+    """The shared response cache, or None when LLM_CACHE is not enabled."""
+    global _cache
+    if LLM_CACHE_ENABLED and _cache is None:
+        _cache = SQLiteResponseCache()
+    return _cache
+
+
+def llm_cache_stats() -> dict:
+    return _cache.stats() if _cache is not None else {"enabled": False}
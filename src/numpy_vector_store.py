@@ -0,0 +1,182 @@
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from src.embedding_cache import model_id
+
+# File layout of an index directory
+MATRIX_FILE = "embeddings.npy"
+SCALES_FILE = "scales.npy"
+CHUNKS_FILE = "chunks.json"
+# Element types of the stored matrix: float32, or int8 with one float32 scale per row (4x smaller)
+DTYPES = ("float32", "int8")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact cosine top-k over a memory-mapped matrix of normalized chunk embeddings.
+
+    An index directory holds embeddings.npy (one row per chunk, float32 or int8), scales.npy
+    for int8 rows, and chunks.json with the chunk texts, metadata and the embedding model.
+    The matrix is opened with mmap_mode="r", so it is paged in by the OS rather than loaded.
+    Written in one go by from_documents or from_embeddings; add_texts and src/policy_ingest.py
+    rewrite the whole directory, reusing the stored vectors of the chunks already in it.
+    """
+
+    def __init__(self, embedding: Embeddings, matrix: np.ndarray, scales, chunks: list[dict], directory: str = None):
+        self.embedding = embedding
+        self.matrix = matrix
+        self.scales = scales
+        self.chunks = chunks
+        self.directory = directory
+        self.dtype = "int8" if scales is not None else "float32"
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        return os.path.exists(os.path.join(directory, CHUNKS_FILE))
+
+    @classmethod
+    def load(cls, directory: str, embedding: Embeddings):
+        with open(os.path.join(directory, CHUNKS_FILE), encoding="utf-8") as f:
+            sidecar = json.load(f)
+        if sidecar["model"] != model_id(embedding):
+            raise ValueError(
+                f"Vector index in {directory} was built with {sidecar['model']}, not {model_id(embedding)}; delete it to rebuild."
+            )
+        matrix = np.load(os.path.join(directory, MATRIX_FILE), mmap_mode="r")
+        scales = np.load(os.path.join(directory, SCALES_FILE)) if sidecar["dtype"] == "int8" else None
+        return cls(embedding, matrix, scales, sidecar["chunks"], directory)
+
+    @classmethod
+    def from_texts(cls, texts: list[str], embedding: Embeddings, metadatas=None, *,
+                   persist_directory: str, dtype: str = "float32", ids=None, **kwargs):
+        texts = list(texts)
+        vectors = np.asarray(embedding.embed_documents(texts), dtype=np.float32)
+        return cls.from_embeddings(texts, vectors, embedding, metadatas=metadatas, ids=ids,
+                                   persist_directory=persist_directory, dtype=dtype)
+
+    @classmethod
+    def from_embeddings(cls, texts: list[str], vectors: np.ndarray, embedding: Embeddings, metadatas=None, ids=None, *,
+                        persist_directory: str, dtype: str = "float32"):
+        """Write an index from vectors computed elsewhere (`embedding` is recorded and used for queries)."""
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown vector index dtype {dtype!r}, expected one of {DTYPES}")
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [None for _ in texts]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = _normalize(vectors.reshape(len(texts), -1)) if len(texts) else np.zeros((0, 0), dtype=np.float32)
+
+        # Write next to the target and swap it in, so a failed build never leaves half an index
+        staging = persist_directory.rstrip("/\\") + ".tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        if dtype == "int8":
+            scales = np.abs(vectors).max(axis=1, initial=0) / 127
+            scales[scales == 0] = 1
+            np.save(os.path.join(staging, SCALES_FILE), scales.astype(np.float32))
+            vectors = np.round(vectors / scales[:, None]).astype(np.int8)
+        np.save(os.path.join(staging, MATRIX_FILE), vectors)
+        with open(os.path.join(staging, CHUNKS_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "model": model_id(embedding),
+                "dtype": dtype,
+                "dimensions": int(vectors.shape[1]) if len(texts) else 0,
+                "chunks": [
+                    {"id": id, "page_content": text, "metadata": metadata}
+                    for id, text, metadata in zip(ids, texts, metadatas)
+                ],
+            }, f, ensure_ascii=False)
+        shutil.rmtree(persist_directory, ignore_errors=True)
+        os.replace(staging, persist_directory)
+        return cls.load(persist_directory, embedding)
+
+    def vectors(self) -> np.ndarray:
+        """A float32 copy of the stored rows (int8 rows are scaled back, so they are approximate)."""
+        if self.scales is None:
+            return np.array(self.matrix, dtype=np.float32)
+        return self.matrix.astype(np.float32) * self.scales[:, None]
+
+    def close(self):
+        """Let go of the memory-mapped matrix, so its directory can be replaced (Windows keeps mapped files locked).
+
+        The store is empty afterwards: searches return nothing until it is loaded again.
+        """
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.scales = None if self.scales is None else np.zeros(0, dtype=np.float32)
+        self.chunks = []
+
+    def _adopt(self, other: "NumpyVectorStore"):
+        self.matrix, self.scales, self.chunks = other.matrix, other.scales, other.chunks
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs) -> list[str]:
+        """Embed `texts` and rewrite the index with them appended; stored chunks with the same ids are replaced."""
+        texts = list(texts)
+        if not texts:
+            return []
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        new_vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+
+        replaced = set(ids)
+        keep = [i for i, chunk in enumerate(self.chunks) if chunk.get("id") not in replaced]
+        kept = [self.chunks[i] for i in keep]
+        vectors = np.concatenate([self.vectors()[keep], new_vectors]) if keep else new_vectors
+        # Unmap the current files before from_embeddings swaps the directory
+        self.close()
+        try:
+            store = self.from_embeddings(
+                [chunk["page_content"] for chunk in kept] + texts, vectors, self.embedding,
+                metadatas=[chunk["metadata"] for chunk in kept] + metadatas,
+                ids=[chunk.get("id") for chunk in kept] + ids,
+                persist_directory=self.directory, dtype=self.dtype,
+            )
+        except Exception:
+            # The staged write failed before the swap, so the old index is still in place
+            self._adopt(self.load(self.directory, self.embedding))
+            raise
+        self._adopt(store)
+        return ids
+
+    def _scores(self, query_vector) -> np.ndarray:
+        query = _normalize(np.asarray(query_vector, dtype=np.float32))
+        scores = self.matrix @ query
+        if self.scales is not None:
+            scores = scores * self.scales
+        return scores
+
+    def similarity_search_with_score_by_vector(self, embedding: list[float], k: int = 4) -> list[tuple[Document, float]]:
+        if not self.chunks:
+            return []
+        scores = self._scores(embedding)
+        k = min(k, len(scores))
+        # Partial sort: only the k best rows are ordered
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(Document(**self.chunks[i]), float(scores[i])) for i in top]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> list[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities already
+        return lambda score: score
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.embedding_cache import model_id
+
+# Every policy document under the RAG directory is indexed
+POLICY_GLOB = os.getenv("POLICY_GLOB", "**/*.md")
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 0
+# Texts per embedding request, and requests in flight at once
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+# Chroma rejects very large single writes
+CHROMA_WRITE_BATCH = 1000
+
+
+def split_documents(raw_documents: list) -> list:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return text_splitter.split_documents(raw_documents)
+
+
+def chunk_id(source: str, text: str) -> str:
+    return hashlib.sha256(f"{source}\0{text}".encode("utf-8")).hexdigest()
+
+
+def load_policy_chunks(directory: str, glob: str = POLICY_GLOB) -> list:
+    """All policy documents under `directory`, split into chunks with content-hash ids.
+
+    The id covers the source path (relative to `directory`) and the chunk text, so an
+    edited paragraph gets a new id and everything else in the file keeps its own.
+    """
+    from langchain_community.document_loaders import DirectoryLoader, TextLoader
+
+    loader = DirectoryLoader(directory, glob=glob, loader_cls=TextLoader,
+                             loader_kwargs={"autodetect_encoding": True}, use_multithreading=True)
+    raw_documents = sorted(loader.load(), key=lambda doc: doc.metadata["source"])
+    for doc in raw_documents:
+        doc.metadata["source"] = os.path.relpath(doc.metadata["source"], directory).replace(os.sep, "/")
+    chunks, seen = [], set()
+    for chunk in split_documents(raw_documents):
+        chunk.id = chunk_id(chunk.metadata["source"], chunk.page_content)
+        # A text repeated within one file is stored once
+        if chunk.id not in seen:
+            seen.add(chunk.id)
+            chunks.append(chunk)
+    return chunks
+
+
+def embed_in_batches(embedding, texts: list[str], batch_size: int = EMBED_BATCH_SIZE,
+                     concurrency: int = EMBED_CONCURRENCY) -> tuple[list[list[float]], int]:
+    """Embed texts with at most `concurrency` requests of `batch_size` texts in flight; returns (vectors, requests)."""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if not batches:
+        return [], 0
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches))), thread_name_prefix="embed") as executor:
+        results = list(executor.map(embedding.embed_documents, batches))
+    return [vector for batch in results for vector in batch], len(batches)
+
+
+class NumpyIndexTarget:
+    """Incremental writes to a NumpyVectorStore directory.
+
+    The index is one matrix, so a change rewrites it, but unchanged chunks reuse their
+    stored vectors instead of being embedded again.
+    """
+
+    def __init__(self, directory: str, embedding, dtype: str = "float32"):
+        self.directory = directory
+        self.embedding = embedding
+        self.dtype = dtype
+
+    def _existing(self):
+        from src.numpy_vector_store import NumpyVectorStore
+
+        if not NumpyVectorStore.exists(self.directory):
+            return None
+        try:
+            return NumpyVectorStore.load(self.directory, self.embedding)
+        except ValueError as e:
+            # Built with another embedding model: everything is embedded again
+            print(f"Rebuilding vector index: {e}")
+            return None
+
+    def existing_ids(self) -> set[str]:
+        store = self._existing()
+        if store is None or store.dtype != self.dtype:
+            return set()
+        return {chunk.get("id") for chunk in store.chunks} - {None}
+
+    def write(self, chunks: list, new_vectors: dict, stale_ids: set):
+        from src.numpy_vector_store import NumpyVectorStore
+
+        store = self._existing()
+        old_vectors = {}
+        if store is not None:
+            old_ids = [chunk.get("id") for chunk in store.chunks]
+            old_vectors = dict(zip(old_ids, store.vectors()))
+            # Unmap the files that are about to be replaced
+            store.close()
+        vectors = [new_vectors[c.id] if c.id in new_vectors else old_vectors[c.id] for c in chunks]
+        NumpyVectorStore.from_embeddings(
+            [c.page_content for c in chunks], np.asarray(vectors, dtype=np.float32), self.embedding,
+            metadatas=[c.metadata for c in chunks], ids=[c.id for c in chunks],
+            persist_directory=self.directory, dtype=self.dtype,
+        )
+
+
+class ChromaTarget:
+    """Incremental upserts and deletes by chunk id in the Chroma store."""
+
+    def __init__(self, directory: str, embedding):
+        from langchain_chroma import Chroma
+
+        self.vectordb = Chroma(persist_directory=directory, embedding_function=embedding)
+
+    def existing_ids(self) -> set[str]:
+        return set(self.vectordb.get(include=[])["ids"])
+
+    def write(self, chunks: list, new_vectors: dict, stale_ids: set):
+        stale = list(stale_ids)
+        for i in range(0, len(stale), CHROMA_WRITE_BATCH):
+            self.vectordb.delete(ids=stale[i:i + CHROMA_WRITE_BATCH])
+        added = [c for c in chunks if c.id in new_vectors]
+        for i in range(0, len(added), CHROMA_WRITE_BATCH):
+            batch = added[i:i + CHROMA_WRITE_BATCH]
+            # Vectors are already computed, so write them directly rather than through add_texts
+            self.vectordb._collection.upsert(
+                ids=[c.id for c in batch],
+                embeddings=[new_vectors[c.id] for c in batch],
+                documents=[c.page_content for c in batch],
+                metadatas=[c.metadata for c in batch],
+            )
+
+
+def ingest_policies(directory: str, embedding, target, before_write=None) -> dict:
+    """Bring `target` in line with the policy documents in `directory`, embedding only new or changed chunks.
+
+    `before_write` is called just before the target is changed, e.g. to close stores reading it.
+    """
+    started = time.perf_counter()
+    chunks = load_policy_chunks(directory)
+    wanted = {chunk.id for chunk in chunks}
+    existing = target.existing_ids()
+    added = [chunk for chunk in chunks if chunk.id not in existing]
+    stale_ids = existing - wanted
+
+    embed_started = time.perf_counter()
+    vectors, requests = embed_in_batches(embedding, [chunk.page_content for chunk in added])
+    embed_seconds = time.perf_counter() - embed_started
+    if added or stale_ids:
+        if before_write is not None:
+            before_write()
+        target.write(chunks, {chunk.id: vector for chunk, vector in zip(added, vectors)}, stale_ids)
+
+    report = {
+        "files": len({chunk.metadata["source"] for chunk in chunks}),
+        "chunks": len(chunks),
+        "added": len(added),
+        "unchanged": len(chunks) - len(added),
+        "deleted": len(stale_ids),
+        "embedding_requests": requests,
+        "embed_seconds": round(embed_seconds, 3),
+        "seconds": round(time.perf_counter() - started, 3),
+        "model": model_id(embedding),
+    }
+    print(f"Policy ingestion: {json.dumps(report)}")
+    return report
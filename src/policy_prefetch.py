@@ -0,0 +1,138 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Start a policy search on the user's own words while the assistant's first call is running
+POLICY_PREFETCH_ENABLED = os.getenv("POLICY_PREFETCH", "1") not in ("0", "false", "False")
+# Share of the model's query terms that must appear in the user message for the prefetch to be used
+PREFETCH_MIN_OVERLAP = float(os.getenv("POLICY_PREFETCH_MIN_OVERLAP", "0.5"))
+# One pending prefetch per conversation thread; the oldest threads are forgotten first
+PREFETCH_MAX_THREADS = 256
+
+STOPWORDS = {
+    "a", "an", "and", "are", "can", "could", "do", "does", "for", "from", "how", "i", "if", "in", "is",
+    "it", "me", "my", "of", "on", "or", "please", "the", "to", "what", "when", "will", "with", "would", "you",
+}
+_WORD = re.compile(r"[a-z0-9]+|[㐀-鿿]")
+
+
+def terms(text: str) -> set[str]:
+    """Lower-cased words (single CJK characters) without stopwords, with a trailing plural 's' dropped."""
+    words = _WORD.findall(text.lower())
+    return {w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words if w not in STOPWORDS}
+
+
+def query_overlap(query: str, text: str) -> float:
+    """Share of the query's terms that also occur in text."""
+    query_terms = terms(query)
+    if not query_terms:
+        return 0.0
+    return len(query_terms & terms(text)) / len(query_terms)
+
+
+class _Prefetch:
+    def __init__(self, text: str):
+        self.text = text
+        self.future = None
+        self.started = time.perf_counter()
+        self.finished = None
+        self.used = False
+
+
+class PolicyPrefetcher:
+    """Runs a policy search on the latest user message in the background.
+
+    start() is called once per user turn, before the assistant. When the model then calls
+    lookup_policy with a query whose terms mostly appear in that message, take() hands back
+    the prefetched result instead of searching again.
+    """
+
+    def __init__(self, search, min_overlap: float = PREFETCH_MIN_OVERLAP, max_threads: int = PREFETCH_MAX_THREADS):
+        self.search = search
+        self.min_overlap = min_overlap
+        self.max_threads = max_threads
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="policy-prefetch")
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"prefetches": 0, "unused": 0, "lookups": 0, "hits": 0, "saved_seconds": 0.0}
+
+    def start(self, thread_id: str, text: str):
+        if not text.strip():
+            return
+        prefetch = _Prefetch(text)
+        prefetch.future = self._executor.submit(self._run, prefetch)
+        with self._lock:
+            previous = self._pending.pop(thread_id, None)
+            if previous is not None and not previous.used:
+                self._stats["unused"] += 1
+            self._pending[thread_id] = prefetch
+            while len(self._pending) > self.max_threads:
+                _, dropped = self._pending.popitem(last=False)
+                if not dropped.used:
+                    self._stats["unused"] += 1
+            self._stats["prefetches"] += 1
+
+    def _run(self, prefetch: _Prefetch):
+        try:
+            return self.search(prefetch.text)
+        finally:
+            prefetch.finished = time.perf_counter()
+
+    def _match(self, thread_id: str, query: str):
+        with self._lock:
+            self._stats["lookups"] += 1
+            prefetch = self._pending.get(thread_id)
+        if prefetch is None or query_overlap(query, prefetch.text) < self.min_overlap:
+            return None
+        return prefetch
+
+    def _hit(self, prefetch: _Prefetch, waited: float):
+        # Without the prefetch the search would have started now and taken its full run time
+        search_seconds = prefetch.finished - prefetch.started
+        saved = max(0.0, search_seconds - waited)
+        with self._lock:
+            prefetch.used = True
+            self._stats["hits"] += 1
+            self._stats["saved_seconds"] += saved
+        print(f"Policy prefetch hit, saved {saved * 1000:.0f} ms")
+
+    def take(self, thread_id: str, query: str):
+        """The prefetched result for a similar query, or None to search as usual."""
+        prefetch = self._match(thread_id, query)
+        if prefetch is None:
+            return None
+        waiting = time.perf_counter()
+        try:
+            result = prefetch.future.result()
+        except Exception as e:
+            print(f"Policy prefetch failed: {e}")
+            return None
+        self._hit(prefetch, time.perf_counter() - waiting)
+        return result
+
+    async def atake(self, thread_id: str, query: str):
+        prefetch = self._match(thread_id, query)
+        if prefetch is None:
+            return None
+        waiting = time.perf_counter()
+        try:
+            result = await asyncio.wrap_future(prefetch.future)
+        except Exception as e:
+            print(f"Policy prefetch failed: {e}")
+            return None
+        self._hit(prefetch, time.perf_counter() - waiting)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["lookups"]
+            return {
+                **self._stats,
+                "saved_seconds": round(self._stats["saved_seconds"], 3),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "pending_threads": len(self._pending),
+            }
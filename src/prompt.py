@@ -27,8 +27,8 @@ SYSTEM_PROMPT = """
                 Tools available:  
                 - `lookup_policy(query: str)`: Consult the company policies to check whether certain options are permitted. Use this before making any flight changes or performing other write events.  
                 - `fetch_user_flight_information(passenger_id)`: Retrieve all tickets for a user, including flight details and seat assignments.  
-                - `get_airport_com_code`: Get the airport code for searching
-                - `search_flights(departure_airport, arrival_airport, start_time, end_time, limit)`: Search for available flights based on filters.  
+                - `resolve_airport(query, k)`: Get the best-matching airport codes for a city or airport name (any language) before searching
+                - `search_flights(departure_airport, arrival_airport, start_time, end_time, limit, page_token)`: Search for available flights based on filters. Results are ordered by departure time; to see later flights, call again with the same filters and the returned `next_page_token` instead of raising `limit`.  
                 - `update_ticket_to_new_flight(ticket_no, new_flight_id, passenger_id)`: Change a user’s flight ticket to a new valid flight.
                 - `cancel_ticket(ticket_no, passenger_id)`: Cancel a flight ticket, showing details and fees before confirming with the user.
                 *** Before updating or cancelling the ticket, make sure to walk through the company policy with the user to confirm the user understand the fee required. ****
@@ -36,7 +36,11 @@ SYSTEM_PROMPT = """
                 - `create_calendar_event`: Create a new booking calendar event.  
                 - `update_calendar_event`: Update an existing booking calendar event.  
                 - `gmail_toolkit`: Send emails to customers regarding booking updates or flight details.
-                
-                \n\nCurrent user:\n<User>\n{user_info}\n</User>
-                Current time: {time}.  
+                """
+
+# Per-turn context, sent as the last message so SYSTEM_PROMPT and the tool schemas stay a
+# byte-identical prefix across requests (which provider-side prompt caching relies on)
+CONTEXT_PROMPT = """
+                Current user:\n<User>\n{user_info}\n</User>
+                Current time: {time}.
                 """
@@ -0,0 +1,117 @@
+import sqlite3
+import sys
+
+from src.sqlite_queries import (
+    USER_FLIGHTS_QUERY,
+    REBOOK_VALIDATION_QUERY,
+    CANCEL_VALIDATION_QUERY,
+    UPDATE_TICKET_FLIGHT,
+    DELETE_TICKET_FLIGHT,
+    build_flight_search_query,
+)
+
+# Prefix of every index owned by this module; anything else in the schema is left alone
+INDEX_PREFIX = "idx_"
+
+# Declared indexes: name -> (table, columns). Each one backs a query in sqlite_queries.py.
+INDEXES = {
+    # search_flights: departure/arrival filters, then the (scheduled_departure, flight_id) order and seek key
+    "idx_flights_route_departure": ("flights", ("departure_airport", "arrival_airport", "scheduled_departure", "flight_id")),
+    "idx_flights_departure_time": ("flights", ("departure_airport", "scheduled_departure", "flight_id")),
+    "idx_flights_arrival_time": ("flights", ("arrival_airport", "scheduled_departure", "flight_id")),
+    "idx_flights_scheduled_departure": ("flights", ("scheduled_departure", "flight_id")),
+    # fetch_user_flight_information join and the new-flight lookup when rebooking
+    "idx_flights_flight_id": ("flights", ("flight_id",)),
+    "idx_tickets_passenger": ("tickets", ("passenger_id", "ticket_no")),
+    "idx_ticket_flights_ticket": ("ticket_flights", ("ticket_no", "flight_id")),
+    "idx_boarding_passes_ticket_flight": ("boarding_passes", ("ticket_no", "flight_id")),
+    # Ticket ownership checks before an update or cancellation
+    "idx_tickets_ticket_owner": ("tickets", ("ticket_no", "passenger_id")),
+}
+
+# Queries that must be answered by an index search, with representative parameters
+HOT_QUERIES = {
+    "fetch_user_flight_information": (USER_FLIGHTS_QUERY, ("8149 604011",)),
+    "search_flights_route": build_flight_search_query("BSL", "CDG", "2024-01-01", "2024-01-08"),
+    "search_flights_departure": build_flight_search_query("BSL", None, "2024-01-01"),
+    "search_flights_arrival": build_flight_search_query(None, "CDG", "2024-01-01"),
+    "search_flights_time_range": build_flight_search_query(None, None, "2024-01-01", "2024-01-08"),
+    "search_flights_next_page": build_flight_search_query("BSL", "CDG", end_time="2024-01-08", after=("2024-01-01", 1)),
+    "search_flights_next_page_any_route": build_flight_search_query(after=("2024-01-01", 1)),
+    "rebook_validation": (
+        REBOOK_VALIDATION_QUERY,
+        {"new_flight_id": 1, "ticket_no": "0000000000000", "passenger_id": "8149 604011"},
+    ),
+    "cancel_validation": (CANCEL_VALIDATION_QUERY, {"ticket_no": "0000000000000", "passenger_id": "8149 604011"}),
+    "update_ticket_flight": (UPDATE_TICKET_FLIGHT, (1, "0000000000000")),
+    "delete_ticket_flight": (DELETE_TICKET_FLIGHT, ("0000000000000",)),
+}
+
+
+def apply_migrations(conn: sqlite3.Connection) -> list[str]:
+    """Bring the indexes in line with INDEXES and return the names of those (re)created.
+
+    The database is restored from an unindexed backup on every reset, so this runs
+    each time the database is prepared. It is idempotent.
+    """
+    existing = {
+        row[0]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    }
+    created = []
+    for name, (table, columns) in INDEXES.items():
+        if name in existing:
+            current = tuple(row[2] for row in conn.execute(f"PRAGMA index_info({name})"))
+            if current == columns:
+                continue
+            # Declaration changed since the index was built
+            conn.execute(f"DROP INDEX {name}")
+        conn.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+        created.append(name)
+    for name in existing:
+        if name.startswith(INDEX_PREFIX) and name not in INDEXES:
+            conn.execute(f"DROP INDEX {name}")
+    if created:
+        conn.execute("ANALYZE")
+    conn.commit()
+    return created
+
+
+def query_plan(conn: sqlite3.Connection, query: str, params=()) -> list[str]:
+    """Return the `EXPLAIN QUERY PLAN` detail lines for a query."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+
+def find_table_scans(conn: sqlite3.Connection) -> dict[str, list[str]]:
+    """Map each hot query that falls back to a SCAN to its offending plan lines."""
+    scans = {}
+    for name, (query, params) in HOT_QUERIES.items():
+        offending = [
+            detail for detail in query_plan(conn, query, params)
+            # A SELECT without FROM reports SCAN CONSTANT ROW, which reads no table
+            if detail.startswith("SCAN") and detail != "SCAN CONSTANT ROW"
+        ]
+        if offending:
+            scans[name] = offending
+    return scans
+
+
+def assert_no_table_scans(conn: sqlite3.Connection):
+    """Raise AssertionError if any hot query is planned as a full scan."""
+    scans = find_table_scans(conn)
+    if scans:
+        raise AssertionError("Hot queries fall back to a SCAN: " + "; ".join(
+            f"{name}: {', '.join(details)}" for name, details in scans.items()
+        ))
+
+
+if __name__ == "__main__":
+    # python -m src.sqlite_migrations [path/to/travel2.sqlite]
+    from src.sqlite_pool import DB_PATH
+
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else DB_PATH)
+    print("Created indexes:", apply_migrations(conn) or "none")
+    for name, (query, params) in HOT_QUERIES.items():
+        print(f"{name}: {' | '.join(query_plan(conn, query, params))}")
+    assert_no_table_scans(conn)
+    print("All hot queries use an index.")
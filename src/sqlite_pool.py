@@ -0,0 +1,176 @@
+import asyncio
+import functools
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+SAVE_DIR = "./src/sqlite_db"
+DB_NAME = "travel2.sqlite"
+DB_PATH = os.path.join(SAVE_DIR, DB_NAME)
+
+# Pool tuning, overridable from the environment
+POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+CACHE_SIZE_KIB = int(os.getenv("SQLITE_CACHE_SIZE_KIB", "65536"))
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHED_STATEMENTS = 256
+
+# Tables touched by the agent tools, read once per new connection to warm its page cache
+WARM_TABLES = ["flights", "tickets", "ticket_flights", "boarding_passes", "airports_data"]
+
+
+class ConnectionPool:
+    """Checkout-based pool of SQLite connections shared by the tools and the UI.
+
+    Connections are opened lazily up to `size`; once the pool is full, callers
+    wait for a connection to be returned. Each connection runs in autocommit
+    mode (`isolation_level=None`), so writers manage their own transactions.
+    """
+
+    def __init__(self, path: str = DB_PATH, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._stats = {"hits": 0, "misses": 0, "waits": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        self._warm(conn)
+        return conn
+
+    def _warm(self, conn: sqlite3.Connection):
+        """Pull the hot tables into the connection's page cache."""
+        existing = {
+            row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        }
+        for table in WARM_TABLES:
+            if table in existing:
+                conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+
+    def _checkout(self) -> sqlite3.Connection:
+        started = None
+        while True:
+            try:
+                conn = self._idle.get(timeout=0.05) if started else self._idle.get_nowait()
+            except queue.Empty:
+                conn = None
+            with self._lock:
+                if conn is not None:
+                    if started is None:
+                        self._stats["hits"] += 1
+                    else:
+                        waited = time.perf_counter() - started
+                        self._stats["waits"] += 1
+                        self._stats["wait_seconds"] += waited
+                        self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+                    return conn
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+                    self._stats["misses"] += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            if started is None:
+                started = time.perf_counter()
+
+    def _checkin(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check a connection out of the pool for the duration of the block."""
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            self._checkin(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            checkouts = self._stats["hits"] + self._stats["misses"] + self._stats["waits"]
+            return {
+                **self._stats,
+                "size": self.size,
+                "open": self._created,
+                "idle": self._idle.qsize(),
+                "hit_rate": self._stats["hits"] / checkouts if checkouts else 0.0,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Dedicated threads for async callers, sized to the pool so they never queue on a connection
+_db_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="sqlite")
+# Bumped whenever the data changes (reset or ticket write), so derived caches can key on it
+_db_version = 0
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def connection():
+    """Context manager yielding a pooled connection to the travel database."""
+    return get_pool().connection()
+
+
+def fetch_dicts(query: str, params=()) -> list[dict]:
+    """Run a read query on a pooled connection and return the rows as dictionaries."""
+    with connection() as conn:
+        cursor = conn.execute(query, params)
+        rows = cursor.fetchall()
+        column_names = [column[0] for column in cursor.description]
+    return [dict(zip(column_names, row)) for row in rows]
+
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """Await a blocking database call without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(func, *args, **kwargs))
+
+
+def pool_stats() -> dict:
+    """Pool hit and wait metrics since startup."""
+    return get_pool().stats()
+
+
+def db_version() -> int:
+    """Version stamp of the database content in this process."""
+    return _db_version
+
+
+def bump_db_version():
+    """Mark the database content as changed."""
+    global _db_version
+    with _pool_lock:
+        _db_version += 1
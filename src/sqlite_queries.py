@@ -0,0 +1,80 @@
+from datetime import date, datetime
+from typing import Optional
+
+# SQL shared by the agent tools, the sidebar and the query-plan check in sqlite_migrations.py
+
+USER_FLIGHTS_QUERY = """
+    SELECT
+        t.ticket_no, t.book_ref,
+        f.flight_id, f.flight_no, f.departure_airport, f.arrival_airport, f.scheduled_departure, f.scheduled_arrival,
+        bp.seat_no, tf.fare_conditions
+    FROM
+        tickets t
+        LEFT JOIN ticket_flights tf ON t.ticket_no = tf.ticket_no
+        LEFT JOIN flights f ON tf.flight_id = f.flight_id
+        LEFT JOIN boarding_passes bp ON bp.ticket_no = t.ticket_no AND bp.flight_id = f.flight_id
+    WHERE
+        t.passenger_id = ?
+    """
+
+AIRPORTS_QUERY = "SELECT airport_code, airport_name, city FROM airports_data WHERE 1 = 1"
+
+# Everything update_ticket_to_new_flight has to check, in one round trip
+REBOOK_VALIDATION_QUERY = """
+    SELECT
+        (SELECT scheduled_departure FROM flights WHERE flight_id = :new_flight_id) AS new_departure,
+        EXISTS (SELECT 1 FROM ticket_flights WHERE ticket_no = :ticket_no) AS has_flight,
+        EXISTS (SELECT 1 FROM tickets WHERE ticket_no = :ticket_no AND passenger_id = :passenger_id) AS is_owner
+    """
+
+# Everything cancel_ticket has to check, in one round trip
+CANCEL_VALIDATION_QUERY = """
+    SELECT
+        EXISTS (SELECT 1 FROM ticket_flights WHERE ticket_no = :ticket_no) AS has_flight,
+        EXISTS (SELECT 1 FROM tickets WHERE ticket_no = :ticket_no AND passenger_id = :passenger_id) AS is_owner
+    """
+
+UPDATE_TICKET_FLIGHT = "UPDATE ticket_flights SET flight_id = ? WHERE ticket_no = ?"
+
+DELETE_TICKET_FLIGHT = "DELETE FROM ticket_flights WHERE ticket_no = ?"
+
+
+def build_flight_search_query(
+    departure_airport: Optional[str] = None,
+    arrival_airport: Optional[str] = None,
+    start_time: Optional[date | datetime] = None,
+    end_time: Optional[date | datetime] = None,
+    limit: int = 20,
+    after: Optional[tuple[str, int]] = None,
+) -> tuple[str, list]:
+    """Build the flight search SQL and its parameters from the optional filters.
+
+    Rows are ordered by (scheduled_departure, flight_id). `after` is the key of the
+    last row already returned; the query then seeks to the rows that follow it.
+    """
+    query = "SELECT * FROM flights WHERE 1 = 1"
+    params = []
+
+    if departure_airport:
+        query += " AND departure_airport = ?"
+        params.append(departure_airport)
+
+    if arrival_airport:
+        query += " AND arrival_airport = ?"
+        params.append(arrival_airport)
+
+    if after:
+        # The last returned row already satisfies start_time, so the seek key replaces it
+        query += " AND (scheduled_departure, flight_id) > (?, ?)"
+        params.extend(after)
+    elif start_time:
+        query += " AND scheduled_departure >= ?"
+        params.append(start_time)
+
+    if end_time:
+        query += " AND scheduled_departure <= ?"
+        params.append(end_time)
+
+    query += " ORDER BY scheduled_departure, flight_id LIMIT ?"
+    params.append(limit)
+    return query, params
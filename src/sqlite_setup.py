@@ -4,84 +4,186 @@ import pandas as pd
 import os
 import requests
 import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from src.itinerary_cache import clear_itineraries
+from src.sqlite_pool import SAVE_DIR, DB_NAME, bump_db_version, connection
+from src.sqlite_migrations import apply_migrations
 
 # URL for the SQLite backup and the local file name
 DB_URL = "https://storage.googleapis.com/benchmarks-artifacts/travel-db/travel2.sqlite"
-SAVE_DIR = "./src/sqlite_db"
-DB_NAME = "travel2.sqlite"
 BACKUP_FILE = "travel2.backup.sqlite"
 DOC_PATH = os.path.join(SAVE_DIR, DB_NAME)
 BACKUP_PATH = os.path.join(SAVE_DIR, BACKUP_FILE)
 
 
+GOLDEN_PREFIX = "travel2.golden-"
+_golden_lock = threading.Lock()
+
+
 def download_db():
-    """Download the SQLite database file if it does not already exist."""
+    """Download the SQLite database file if it does not already exist, then reset it for the demo."""
     # The backup lets us restart for each tutorial section
-    if not os.path.exists(DOC_PATH):
+    if not os.path.exists(BACKUP_PATH):
         # st.info("Downloading the SQLite database...")
         os.makedirs(SAVE_DIR, exist_ok=True)
         response = requests.get(DB_URL)
         response.raise_for_status()  # Ensure the request was successful
-        with open(DOC_PATH, "wb") as f:
-            f.write(response.content)
         # Backup - we will use this to "reset" our DB in each section
-        shutil.copy(DOC_PATH, BACKUP_PATH)
-
-    #     st.success("Database downloaded successfully!")
-    # else:
-    #     st.info("Database file already exists locally.")
+        with open(BACKUP_PATH, "wb") as f:
+            f.write(response.content)
         print("Sqlite database downloaded successfully!")
-    else:
-        # Replace travel2.sqlite from the backup file
-        print("Resetting sqlite backup")
-        os.remove(DOC_PATH)
-        shutil.copy(BACKUP_PATH, DOC_PATH)
 
-    # Convert the flights to present time for our tutorial
-    update_dates(DOC_PATH)
+    reset_db()
+
+
+def golden_image_path(day=None) -> str:
+    """Path of the pre-rebased, pre-indexed snapshot for a calendar day (default: today)."""
+    day = day or datetime.now().date()
+    return os.path.join(SAVE_DIR, f"{GOLDEN_PREFIX}{day:%Y%m%d}.sqlite")
+
+
+def build_golden_image() -> str:
+    """Create today's golden image from the backup if needed and drop the ones from earlier days."""
+    path = golden_image_path()
+    with _golden_lock:
+        if not os.path.exists(path):
+            print("Building golden sqlite image")
+            fd, tmp_path = tempfile.mkstemp(dir=SAVE_DIR, suffix=".tmp")
+            os.close(fd)
+            try:
+                # Convert the flights to present time for our tutorial
+                update_dates(tmp_path)
+                # The backup ships without indexes, so create them once on the snapshot
+                conn = sqlite3.connect(tmp_path)
+                try:
+                    apply_migrations(conn)
+                finally:
+                    conn.close()
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        for name in os.listdir(SAVE_DIR):
+            stale = os.path.join(SAVE_DIR, name)
+            if name.startswith(GOLDEN_PREFIX) and stale != path:
+                os.remove(stale)
+    return path
+
+
+def reset_db():
+    """Restore the demo database from today's golden image.
+
+    The copy goes through the SQLite online backup API into a pooled connection,
+    so open connections stay valid and simply see the restored pages.
+    """
+    started = time.perf_counter()
+    golden = build_golden_image()
+    source = sqlite3.connect(f"file:{golden}?mode=ro", uri=True)
+    try:
+        with connection() as conn:
+            source.backup(conn)
+    finally:
+        source.close()
+    clear_itineraries()
+    bump_db_version()
+    print(f"Sqlite database reset in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+# Timestamp columns shifted to the present, per table. Every other table and column is left untouched.
+REBASED_COLUMNS = {
+    "bookings": ["book_date"],
+    "flights": ["scheduled_departure", "scheduled_arrival", "actual_departure", "actual_arrival"],
+}
+# bookings.book_date is stored in UTC after rebasing; flight times keep their own offset
+UTC_TABLES = {"bookings"}
+# The dump marks missing timestamps with a literal \N
+NULL_MARKER = "\\N"
+
+
+def _parse_timestamp(value):
+    if value is None or value == NULL_MARKER:
+        return None
+    return datetime.fromisoformat(value)
+
+
+def _sort_key(value):
+    """SQLite scalar function ordering timestamps by instant, or NULL when unparseable.
+
+    Replaces julianday(), which returns NULL for offsets without minutes ("+01") that
+    the dump may contain; naive timestamps are read as UTC, as julianday() does.
+    """
+    try:
+        ts = _parse_timestamp(value)
+    except ValueError:
+        return None
+    if ts is None:
+        return None
+    return (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).timestamp()
+
+
+def _rebase_function(time_diff: timedelta, to_utc: bool):
+    """SQLite scalar function shifting one timestamp string by `time_diff`."""
+    def rebase(value):
+        ts = _parse_timestamp(value)
+        if ts is None:
+            return None
+        ts = ts + time_diff
+        if to_utc:
+            ts = ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+        return ts.isoformat(" ", timespec="microseconds")
+    return rebase
 
 
 # Convert the flights to present time for our tutorial
-def update_dates(file):
-    shutil.copy(BACKUP_PATH, file)
-    conn = sqlite3.connect(file)
-    cursor = conn.cursor()
-
-    tables = pd.read_sql(
-        "SELECT name FROM sqlite_master WHERE type='table';", conn
-    ).name.tolist()
-    tdf = {}
-    for t in tables:
-        tdf[t] = pd.read_sql(f"SELECT * from {t}", conn)
-
-    example_time = pd.to_datetime(
-        tdf["flights"]["actual_departure"].replace("\\N", pd.NaT)
-    ).max()
-    current_time = pd.to_datetime("now").tz_localize(example_time.tz)
-    time_diff = current_time - example_time + pd.Timedelta(days=31)
-
-    tdf["bookings"]["book_date"] = (
-        pd.to_datetime(tdf["bookings"]["book_date"].replace("\\N", pd.NaT), utc=True)
-        + time_diff
-    )
-
-    datetime_columns = [
-        "scheduled_departure",
-        "scheduled_arrival",
-        "actual_departure",
-        "actual_arrival",
-    ]
-    for column in datetime_columns:
-        tdf["flights"][column] = (
-            pd.to_datetime(tdf["flights"][column].replace("\\N", pd.NaT)) + time_diff
-        )
-
-    for table_name, df in tdf.items():
-        df.to_sql(table_name, conn, if_exists="replace", index=False)
-    del df
-    del tdf
-    conn.commit()
-    conn.close()
+def update_dates(file, backup_path=BACKUP_PATH):
+    """Reset `file` from the backup and shift its timestamps so the latest departure is a month from now.
+
+    The offset comes from a single aggregate query; the rebased columns are then
+    rewritten with one set-based UPDATE per table inside a single transaction.
+    """
+    shutil.copy(backup_path, file)
+    conn = sqlite3.connect(file, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.create_function("timestamp_key", 1, _sort_key, deterministic=True)
+        example_value, latest = conn.execute(
+            "SELECT actual_departure, MAX(timestamp_key(actual_departure)) FROM flights "
+            "WHERE actual_departure IS NOT NULL AND actual_departure != ?",
+            (NULL_MARKER,),
+        ).fetchone()
+        if latest is None:
+            sample = conn.execute(
+                "SELECT actual_departure FROM flights WHERE actual_departure IS NOT NULL AND actual_departure != ? LIMIT 1",
+                (NULL_MARKER,),
+            ).fetchone()
+            raise ValueError(
+                f"No parseable flights.actual_departure to rebase the demo dates on "
+                f"(expected ISO 8601 timestamps, found {sample[0] if sample else 'no values'!r})"
+            )
+        example_time = _parse_timestamp(example_value)
+        # Same convention as the original tutorial: the current UTC wall-clock time read in the example's zone
+        current_time = datetime.now(timezone.utc).replace(tzinfo=example_time.tzinfo)
+        time_diff = current_time - example_time + timedelta(days=31)
+
+        for table, columns in REBASED_COLUMNS.items():
+            function_name = f"rebase_{table}"
+            conn.create_function(
+                function_name, 1, _rebase_function(time_diff, table in UTC_TABLES), deterministic=True
+            )
+            assignments = ", ".join(f"{column} = {function_name}({column})" for column in columns)
+            conn.execute(f"UPDATE {table} SET {assignments}")
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
 
     return file
 
@@ -89,7 +191,7 @@ def update_dates(file):
 def run_query(query):
     """Run a SQL query on the SQLite database and return the results as a DataFrame."""
     try:
-        with sqlite3.connect(DOC_PATH) as conn:
+        with connection() as conn:
             df = pd.read_sql_query(query, conn)
         return df
     except Exception as e:
@@ -1,17 +1,33 @@
-import sqlite3
+import base64
+import hashlib
+import json
 from datetime import date, datetime
 from typing import Optional, Annotated
-import os
 
-import pytz
 from langchain_core.tools import tool
 from langchain_core.runnables import RunnableConfig
 
-
-SAVE_DIR = "./src/sqlite_db"
-DB_NAME = "travel2.sqlite"
-db = os.path.join(SAVE_DIR, DB_NAME)
-
+from src.airport_resolver import get_airport_index
+from src.itinerary_cache import get_itinerary
+from src.sqlite_pool import fetch_dicts, run_in_db_executor
+from src.sqlite_queries import build_flight_search_query
+from src.ticket_writes import WriteResult, rebook_ticket, cancel_ticket_flights
+from src.tools import ToolOutputPolicy, with_executor
+
+# Server-side cap on search_flights page size, whatever limit the model asks for
+MAX_PAGE_SIZE = 20
+# Upper bound on resolve_airport matches returned to the model
+MAX_AIRPORT_MATCHES = 10
+# What one search_flights page puts in the conversation. SELECT * rows lose aircraft_code and the
+# actual_* columns, which are empty for future flights, and a page ends early rather than exceed the budget.
+SEARCH_FLIGHTS_OUTPUT = ToolOutputPolicy(
+    columns=["flight_id", "flight_no", "departure_airport", "arrival_airport",
+             "scheduled_departure", "scheduled_arrival", "status"],
+    max_tokens=1500,
+)
+
+
+@with_executor(run_in_db_executor)
 @tool
 def fetch_user_flight_information(config: RunnableConfig) -> list[dict]:
     """Fetch all tickets for the user along with corresponding flight information and seat assignments.
@@ -27,29 +43,7 @@ def fetch_user_flight_information(config: RunnableConfig) -> list[dict]:
     if not passenger_id:
         raise ValueError("No passenger ID configured.")
 
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    query = """
-    SELECT 
-        t.ticket_no, t.book_ref,
-        f.flight_id, f.flight_no, f.departure_airport, f.arrival_airport, f.scheduled_departure, f.scheduled_arrival,
-        bp.seat_no, tf.fare_conditions
-    FROM 
-        tickets t
-        LEFT JOIN ticket_flights tf ON t.ticket_no = tf.ticket_no
-        LEFT JOIN flights f ON tf.flight_id = f.flight_id
-        LEFT JOIN boarding_passes bp ON bp.ticket_no = t.ticket_no AND bp.flight_id = f.flight_id
-    WHERE 
-        t.passenger_id = ?
-    """
-    cursor.execute(query, (passenger_id,))
-    rows = cursor.fetchall()
-    column_names = [column[0] for column in cursor.description]
-    results = [dict(zip(column_names, row)) for row in rows]
-
-    cursor.close()
-    conn.close()
+    results = get_itinerary(passenger_id)
 
     user_info = {
         "name": configuration.get("passenger_name", None),
@@ -65,66 +59,77 @@ def fetch_user_flight_information(config: RunnableConfig) -> list[dict]:
 
     return results
 
+@with_executor(run_in_db_executor)
 @tool
-def get_airport_code():
-    """Get the airport codes from the airport_codes table."""
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
+def resolve_airport(
+    query: Annotated[str, "City, airport name or airport code, in any language"],
+    k: int = 5,
+) -> list[dict]:
+    """Find the airport codes that best match a city, airport name or code.
 
-    query = "SELECT airport_code, airport_name FROM airports_data WHERE 1 = 1"
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    column_names = [column[0] for column in cursor.description]
-    results = [dict(zip(column_names, row)) for row in rows]
+    Returns up to k matches (best first) with airport_code, airport_name, city and a match score.
+    """
+    return get_airport_index().search(query, max(1, min(k, MAX_AIRPORT_MATCHES)))
 
-    cursor.close()
-    conn.close()
+def _search_fingerprint(*filters) -> str:
+    return hashlib.sha256(json.dumps([str(f) if f else None for f in filters]).encode()).hexdigest()[:16]
+
+
+def _encode_page_token(fingerprint: str, last_row: dict) -> str:
+    payload = json.dumps([fingerprint, last_row["scheduled_departure"], last_row["flight_id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_page_token(token: str, fingerprint: str) -> tuple[str, int]:
+    try:
+        token_fingerprint, scheduled_departure, flight_id = json.loads(base64.urlsafe_b64decode(token))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid page_token; start a new search without it.")
+    if token_fingerprint != fingerprint:
+        raise ValueError("page_token belongs to a search with different filters; repeat the same filters or start a new search.")
+    return scheduled_departure, flight_id
 
-    return results
 
+@with_executor(run_in_db_executor)
 @tool
 def search_flights(
-    departure_airport: Annotated[Optional[str], "airport_code must be retrieved from the tool get_airport_code"] = None,
-    arrival_airport: Annotated[Optional[str], "airport_code must be retrieved from the tool get_airport_code"]= None,
+    departure_airport: Annotated[Optional[str], "airport_code must be retrieved from the tool resolve_airport"] = None,
+    arrival_airport: Annotated[Optional[str], "airport_code must be retrieved from the tool resolve_airport"]= None,
     start_time: Optional[date | datetime] = None,
     end_time: Optional[date | datetime] = None,
     limit: int = 20,
-) -> list[dict]:
-    """Search for flights based on departure airport, arrival airport, and departure time range."""
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    query = "SELECT * FROM flights WHERE 1 = 1"
-    params = []
-
-    if departure_airport:
-        query += " AND departure_airport = ?"
-        params.append(departure_airport)
-
-    if arrival_airport:
-        query += " AND arrival_airport = ?"
-        params.append(arrival_airport)
-
-    if start_time:
-        query += " AND scheduled_departure >= ?"
-        params.append(start_time)
-
-    if end_time:
-        query += " AND scheduled_departure <= ?"
-        params.append(end_time)
-    query += " LIMIT ?"
-    params.append(limit)
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    column_names = [column[0] for column in cursor.description]
-    results = [dict(zip(column_names, row)) for row in rows]
-
-    cursor.close()
-    conn.close()
+    page_token: Annotated[Optional[str], "next_page_token from a previous call with the same filters, to see the later flights"] = None,
+) -> dict:
+    """Search for flights based on departure airport, arrival airport, and departure time range.
 
-    return results
+    Flights are ordered by scheduled departure. If more flights match, the result has a
+    `next_page_token`; call again with the same filters and that token to get the next page.
+    A page may hold fewer than `limit` flights when they would not fit in the context.
+    """
+    fingerprint = _search_fingerprint(departure_airport, arrival_airport, start_time, end_time)
+    after = _decode_page_token(page_token, fingerprint) if page_token else None
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    # Fetch one extra row to know whether another page exists
+    query, params = build_flight_search_query(
+        departure_airport, arrival_airport, start_time, end_time, limit + 1, after
+    )
+    rows = fetch_dicts(query, params)
+    flights = SEARCH_FLIGHTS_OUTPUT.fit_rows(rows[:limit])
+    # A page cut short by the token budget continues after its last flight, like a full one
+    next_page_token = _encode_page_token(fingerprint, flights[-1]) if len(rows) > len(flights) else None
+    return {"flights": flights, "next_page_token": next_page_token}
 
 
+def _write_failure_message(result: WriteResult, ticket_no: str, passenger_id: str) -> str:
+    if result is WriteResult.TICKET_NOT_FOUND:
+        return "No existing ticket found for the given ticket number."
+    if result is WriteResult.NOT_OWNER:
+        return f"Current signed-in passenger with ID {passenger_id} not the owner of ticket {ticket_no}"
+    return "The booking system is busy and the ticket was not changed. Please try again in a moment."
+
+
+@with_executor(run_in_db_executor)
 @tool
 def update_ticket_to_new_flight(
     ticket_no: str, new_flight_id: int, *, config: RunnableConfig
@@ -138,65 +143,22 @@ def update_ticket_to_new_flight(
     if not passenger_id:
         raise ValueError("No passenger ID configured.")
 
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT departure_airport, arrival_airport, scheduled_departure FROM flights WHERE flight_id = ?",
-        (new_flight_id,),
-    )
-    new_flight = cursor.fetchone()
-    if not new_flight:
-        cursor.close()
-        conn.close()
-        return "Invalid new flight ID provided."
-    column_names = [column[0] for column in cursor.description]
-    new_flight_dict = dict(zip(column_names, new_flight))
-    timezone = pytz.timezone("Etc/GMT-3")
-    current_time = datetime.now(tz=timezone)
-    departure_time = datetime.strptime(
-        new_flight_dict["scheduled_departure"], "%Y-%m-%d %H:%M:%S.%f%z"
-    )
-    time_until = (departure_time - current_time).total_seconds()
-    if time_until < (3 * 3600):
-        return f"Not permitted to reschedule to a flight that is less than 3 hours from the current time. Selected flight is at {departure_time}."
-
-    cursor.execute(
-        "SELECT flight_id FROM ticket_flights WHERE ticket_no = ?", (ticket_no,)
-    )
-    current_flight = cursor.fetchone()
-    if not current_flight:
-        cursor.close()
-        conn.close()
-        return "No existing ticket found for the given ticket number."
-
-    # Check the signed-in user actually has this ticket
-    cursor.execute(
-        "SELECT * FROM tickets WHERE ticket_no = ? AND passenger_id = ?",
-        (ticket_no, passenger_id),
-    )
-    current_ticket = cursor.fetchone()
-    if not current_ticket:
-        cursor.close()
-        conn.close()
-        return f"Current signed-in passenger with ID {passenger_id} not the owner of ticket {ticket_no}"
-
     # In a real application, you'd likely add additional checks here to enforce business logic,
     # like "does the new departure airport match the current ticket", etc.
     # While it's best to try to be *proactive* in 'type-hinting' policies to the LLM
     # it's inevitably going to get things wrong, so you **also** need to ensure your
     # API enforces valid behavior
-    cursor.execute(
-        "UPDATE ticket_flights SET flight_id = ? WHERE ticket_no = ?",
-        (new_flight_id, ticket_no),
-    )
-    conn.commit()
-
-    cursor.close()
-    conn.close()
-    return "Ticket successfully updated to new flight."
+    result, details = rebook_ticket(ticket_no, new_flight_id, passenger_id)
+    if result is WriteResult.OK:
+        return "Ticket successfully updated to new flight."
+    if result is WriteResult.INVALID_FLIGHT:
+        return "Invalid new flight ID provided."
+    if result is WriteResult.TOO_SOON:
+        return f"Not permitted to reschedule to a flight that is less than 3 hours from the current time. Selected flight is at {details['departure_time']}."
+    return _write_failure_message(result, ticket_no, passenger_id)
 
 
+@with_executor(run_in_db_executor)
 @tool
 def cancel_ticket(ticket_no: str, *, config: RunnableConfig) -> str:
     """
@@ -207,32 +169,7 @@ def cancel_ticket(ticket_no: str, *, config: RunnableConfig) -> str:
     passenger_id = configuration.get("passenger_id", None)
     if not passenger_id:
         raise ValueError("No passenger ID configured.")
-    conn = sqlite3.connect(db)
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT flight_id FROM ticket_flights WHERE ticket_no = ?", (ticket_no,)
-    )
-    existing_ticket = cursor.fetchone()
-    if not existing_ticket:
-        cursor.close()
-        conn.close()
-        return "No existing ticket found for the given ticket number."
-
-    # Check the signed-in user actually has this ticket
-    cursor.execute(
-        "SELECT ticket_no FROM tickets WHERE ticket_no = ? AND passenger_id = ?",
-        (ticket_no, passenger_id),
-    )
-    current_ticket = cursor.fetchone()
-    if not current_ticket:
-        cursor.close()
-        conn.close()
-        return f"Current signed-in passenger with ID {passenger_id} not the owner of ticket {ticket_no}"
-
-    cursor.execute("DELETE FROM ticket_flights WHERE ticket_no = ?", (ticket_no,))
-    conn.commit()
-
-    cursor.close()
-    conn.close()
-    return "Ticket successfully cancelled."
\ No newline at end of file
+    result, _ = cancel_ticket_flights(ticket_no, passenger_id)
+    if result is WriteResult.OK:
+        return "Ticket successfully cancelled."
+    return _write_failure_message(result, ticket_no, passenger_id)
@@ -0,0 +1,106 @@
+import sqlite3
+from datetime import datetime
+from enum import Enum
+
+import pytz
+
+from src.itinerary_cache import invalidate_itinerary
+from src.sqlite_pool import bump_db_version, connection
+from src.sqlite_queries import (
+    REBOOK_VALIDATION_QUERY,
+    CANCEL_VALIDATION_QUERY,
+    UPDATE_TICKET_FLIGHT,
+    DELETE_TICKET_FLIGHT,
+)
+
+# Flights departing sooner than this cannot be rebooked onto
+MIN_REBOOK_NOTICE_SECONDS = 3 * 3600
+
+
+class WriteResult(str, Enum):
+    """Outcome of a ticket write, checked in this order."""
+    OK = "ok"
+    INVALID_FLIGHT = "invalid_flight"
+    TOO_SOON = "too_soon"
+    TICKET_NOT_FOUND = "ticket_not_found"
+    NOT_OWNER = "not_owner"
+    LOCKED = "locked"
+
+
+def _run_write(validate, apply) -> tuple[WriteResult, dict]:
+    """Run validation and the write as one BEGIN IMMEDIATE transaction.
+
+    BEGIN IMMEDIATE takes the write lock up front, so nothing can change between the
+    checks and the write. Waiting for that lock is bounded by the pool's busy_timeout.
+    """
+    with connection() as conn:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            return WriteResult.LOCKED, {"error": str(e)}
+        try:
+            result, details = validate(conn)
+            if result is WriteResult.OK:
+                apply(conn)
+                conn.execute("COMMIT")
+            else:
+                conn.execute("ROLLBACK")
+            return result, details
+        except sqlite3.OperationalError as e:
+            conn.execute("ROLLBACK")
+            if "locked" in str(e) or "busy" in str(e):
+                return WriteResult.LOCKED, {"error": str(e)}
+            raise
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def rebook_ticket(ticket_no: str, new_flight_id: int, passenger_id: str) -> tuple[WriteResult, dict]:
+    """Move a passenger's ticket to another flight."""
+    params = {"new_flight_id": new_flight_id, "ticket_no": ticket_no, "passenger_id": passenger_id}
+
+    def validate(conn):
+        new_departure, has_flight, is_owner = conn.execute(REBOOK_VALIDATION_QUERY, params).fetchone()
+        if new_departure is None:
+            return WriteResult.INVALID_FLIGHT, {}
+        departure_time = datetime.strptime(new_departure, "%Y-%m-%d %H:%M:%S.%f%z")
+        current_time = datetime.now(tz=pytz.timezone("Etc/GMT-3"))
+        if (departure_time - current_time).total_seconds() < MIN_REBOOK_NOTICE_SECONDS:
+            return WriteResult.TOO_SOON, {"departure_time": departure_time}
+        if not has_flight:
+            return WriteResult.TICKET_NOT_FOUND, {}
+        if not is_owner:
+            return WriteResult.NOT_OWNER, {}
+        return WriteResult.OK, {"departure_time": departure_time}
+
+    def apply(conn):
+        conn.execute(UPDATE_TICKET_FLIGHT, (new_flight_id, ticket_no))
+
+    result, details = _run_write(validate, apply)
+    if result is WriteResult.OK:
+        invalidate_itinerary(passenger_id)
+        bump_db_version()
+    return result, details
+
+
+def cancel_ticket_flights(ticket_no: str, passenger_id: str) -> tuple[WriteResult, dict]:
+    """Remove a passenger's ticket from its flights."""
+    params = {"ticket_no": ticket_no, "passenger_id": passenger_id}
+
+    def validate(conn):
+        has_flight, is_owner = conn.execute(CANCEL_VALIDATION_QUERY, params).fetchone()
+        if not has_flight:
+            return WriteResult.TICKET_NOT_FOUND, {}
+        if not is_owner:
+            return WriteResult.NOT_OWNER, {}
+        return WriteResult.OK, {}
+
+    def apply(conn):
+        conn.execute(DELETE_TICKET_FLIGHT, (ticket_no,))
+
+    result, details = _run_write(validate, apply)
+    if result is WriteResult.OK:
+        invalidate_itinerary(passenger_id)
+        bump_db_version()
+    return result, details
@@ -6,15 +6,16 @@ from dotenv import load_dotenv
 from typing import Annotated
 
 from langchain_core.tools import tool
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 
 load_dotenv()
 #
-# # Google Calendar toolkit
+# # Google Calendar toolkit (the Google client libraries are slow to import, so only load them with it)
+# from google.auth.transport.requests import Request
+# from google.oauth2.credentials import Credentials
+# from google_auth_oauthlib.flow import InstalledAppFlow
+# from googleapiclient.discovery import build
+# from googleapiclient.errors import HttpError
+#
 # SCOPES = ["https://www.googleapis.com/auth/calendar", "https://mail.google.com/"]
 # # Load stored OAuth tokens/credentials from your JSON file.
 # # (The method may vary depending on your OAuth flow.)
@@ -148,10 +149,38 @@ load_dotenv()
 
 
 # Utilities
-from langchain_core.messages import ToolMessage
+import asyncio
+import functools
+import threading
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import BaseTool
 from langgraph.prebuilt import ToolNode
 
+from src.context_window import count_tokens
+
+
+def with_coroutine(coroutine):
+    """Decorator attaching a native async implementation to a sync @tool."""
+    def decorate(sync_tool: BaseTool) -> BaseTool:
+        return sync_tool.model_copy(update={"coroutine": coroutine})
+    return decorate
+
+
+def with_executor(run_in_executor):
+    """Decorator giving a sync @tool an async implementation that runs its body via `run_in_executor`."""
+    def decorate(sync_tool: BaseTool) -> BaseTool:
+        func = sync_tool.func
+
+        # wraps() keeps the signature, so the RunnableConfig argument is still injected
+        @functools.wraps(func)
+        async def coroutine(*args, **kwargs):
+            return await run_in_executor(func, *args, **kwargs)
+
+        return with_coroutine(coroutine)(sync_tool)
+    return decorate
+
 
 def handle_tool_error(state) -> dict:
     error = state.get("error")
@@ -167,10 +196,164 @@ def handle_tool_error(state) -> dict:
     }
 
 
-def create_tool_node_with_fallback(tools: list) -> dict:
-    return ToolNode(tools).with_fallbacks(
+class ToolOutputPolicy:
+    """How much of one tool's output is put into the conversation.
+
+    columns: keys kept in each row (rows are the JSON list itself)
+    max_rows: rows kept, the rest are replaced by an "N more rows" note
+    max_tokens: budget for the whole output; rows are dropped, or text is cut, to fit
+
+    Dropped rows are only reachable with a narrower query, so don't give a row limit to
+    tools that take none. A paged tool sizes its own pages with fit_rows instead, so its
+    page token can continue after the last row that was kept.
+    """
+
+    def __init__(self, columns=None, max_rows=None, max_tokens=None):
+        self.columns = columns
+        self.max_rows = max_rows
+        self.max_tokens = max_tokens
+
+    def fit_rows(self, rows: list) -> list:
+        """The leading rows, projected to `columns`, that fit within max_rows and max_tokens."""
+        if self.columns:
+            rows = [{k: row[k] for k in self.columns if k in row} if isinstance(row, dict) else row for row in rows]
+        if self.max_rows is not None:
+            rows = rows[:self.max_rows]
+        while self.max_tokens and len(rows) > 1 and count_tokens(self._dumps(rows)) > self.max_tokens:
+            rows = rows[:-1]
+        return rows
+
+    @staticmethod
+    def _dumps(value) -> str:
+        return json.dumps(value, ensure_ascii=False, default=str)
+
+    def apply(self, content: str) -> str:
+        try:
+            data = json.loads(content)
+        except ValueError:
+            return self._truncate_text(content)
+        if not isinstance(data, list):
+            return self._truncate_text(content)
+
+        rows = self.fit_rows(data)
+        text = self._dumps(rows)
+        if len(rows) < len(data):
+            text += f"\n[{len(data) - len(rows)} more rows not shown; narrow the query to see them]"
+        return text
+
+    def _truncate_text(self, text: str) -> str:
+        tokens = count_tokens(text)
+        if not self.max_tokens or tokens <= self.max_tokens:
+            return text
+        cut = len(text) * self.max_tokens // tokens
+        while cut > 0 and count_tokens(text[:cut]) > self.max_tokens:
+            cut = cut * 9 // 10
+        return text[:cut] + f"\n[... truncated, about {tokens - count_tokens(text[:cut])} more tokens]"
+
+
+# Per tool: calls, and bytes / tokens before and after its policy
+_output_stats = {}
+_output_stats_lock = threading.Lock()
+
+
+def _record_output(name: str, before: str, after: str):
+    sizes = (len(before.encode("utf-8")), count_tokens(before), len(after.encode("utf-8")), count_tokens(after))
+    with _output_stats_lock:
+        stats = _output_stats.setdefault(name, {"calls": 0, "bytes": 0, "tokens": 0, "sent_bytes": 0, "sent_tokens": 0})
+        stats["calls"] += 1
+        for key, size in zip(("bytes", "tokens", "sent_bytes", "sent_tokens"), sizes):
+            stats[key] += size
+    print(f"Tool output {name}: {sizes[0]} B / {sizes[1]} tokens, sent {sizes[2]} B / {sizes[3]} tokens")
+
+
+def tool_output_stats() -> dict:
+    """What each tool has added to the context since startup."""
+    with _output_stats_lock:
+        return {name: dict(stats) for name, stats in _output_stats.items()}
+
+
+def govern_tool_output(result, policies: dict):
+    """Apply the output policy of each ToolMessage's tool and record its size."""
+    if not isinstance(result, dict) or "messages" not in result:
+        return result
+    messages = []
+    for message in result["messages"]:
+        if isinstance(message, ToolMessage) and isinstance(message.content, str):
+            name = message.name or "unknown"
+            policy = policies.get(name)
+            content = policy.apply(message.content) if policy else message.content
+            _record_output(name, message.content, content)
+            if content != message.content:
+                message = message.model_copy(update={"content": content})
+        messages.append(message)
+    return {**result, "messages": messages}
+
+
+def create_tool_node_with_fallback(tools: list, output_policies: dict = None) -> dict:
+    node = ToolNode(tools).with_fallbacks(
         [RunnableLambda(handle_tool_error)], exception_key="error"
     )
+    # Every tool output passes the governor, so its size is logged even without a policy
+    return node | RunnableLambda(functools.partial(govern_tool_output, policies=output_policies or {}))
+
+
+def pending_tool_calls(messages: list, include=None, exclude=()) -> list[dict]:
+    """Tool calls of the latest AIMessage that have no ToolMessage answer yet.
+
+    `include` / `exclude` filter by tool name, so one AIMessage can be split across nodes.
+    """
+    answered = set()
+    for message in reversed(messages):
+        if isinstance(message, ToolMessage):
+            answered.add(message.tool_call_id)
+        elif isinstance(message, AIMessage):
+            return [
+                tc for tc in message.tool_calls
+                if tc["id"] not in answered
+                and (include is None or tc["name"] in include)
+                and tc["name"] not in exclude
+            ]
+        elif isinstance(message, HumanMessage):
+            break
+    return []
+
+
+def create_partial_tool_node(tools: list, select_calls, max_concurrency=None, output_policies: dict = None):
+    """Tool node that runs only the pending calls picked by `select_calls(messages)`.
+
+    The picked calls run concurrently, at most `max_concurrency` at a time: on a thread
+    pool when invoked synchronously, and behind a semaphore when invoked asynchronously.
+    """
+    tool_node = create_tool_node_with_fallback(tools, output_policies)
+
+    def prepare(state, config):
+        # ToolNode runs every call of the last message, so hand it only the selected ones
+        calls = select_calls(state["messages"])
+        state = {**state, "messages": [AIMessage(content="", tool_calls=calls)]}
+        if max_concurrency:
+            config = {**config, "max_concurrency": max_concurrency}
+        return state, config
+
+    def run(state, config):
+        return tool_node.invoke(*prepare(state, config))
+
+    async def arun(state, config):
+        state, config = prepare(state, config)
+        calls = state["messages"][-1].tool_calls
+        if not max_concurrency or len(calls) <= max_concurrency:
+            return await tool_node.ainvoke(state, config)
+
+        # ToolNode gathers all its calls at once, so give it one call at a time under the cap
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run_one(call):
+            async with semaphore:
+                return await tool_node.ainvoke({**state, "messages": [AIMessage(content="", tool_calls=[call])]}, config)
+
+        results = await asyncio.gather(*(run_one(call) for call in calls))
+        return {"messages": [message for result in results for message in result["messages"]]}
+
+    return RunnableLambda(run, afunc=arun)
 
 
 def _print_event(event: dict, _printed: set, max_length=1500):
@@ -1,14 +1,12 @@
 import re
 import os
+import functools
 from dotenv import load_dotenv
 import requests
-import numpy as np
-import openai
+from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain_openai import OpenAIEmbeddings, AzureOpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
+from src.policy_prefetch import PolicyPrefetcher
+from src.tools import with_coroutine
 
 
 load_dotenv()
@@ -16,13 +14,70 @@ load_dotenv()
 # Define the directory where you want to save the file
 SAVE_DIR = "./src/rag_doc"
 FILE_NAME = "swiss_faq.md"
+DOC_PATH = os.path.join(SAVE_DIR, FILE_NAME)
 PERSIST_DIR = "./src/vector_db"
-embedding = AzureOpenAIEmbeddings(model="text-embedding-3-small")
+# "numpy": in-process exact search over a memory-mapped matrix (src/numpy_vector_store.py); "chroma": the Chroma store
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "numpy")
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", "./src/vector_index")
+# float32, or int8 for a 4x smaller matrix
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+
+
+# The embedding client and Chroma (with its own heavy imports) are only built on first use,
+# so importing this module stays cheap
+@functools.lru_cache(maxsize=1)
+def get_embedding():
+    from langchain_openai import AzureOpenAIEmbeddings
+    from src.embedding_cache import cached_query_embeddings
+
+    # Repeated policy queries are embedded once and then served from a local cache
+    return cached_query_embeddings(AzureOpenAIEmbeddings(model="text-embedding-3-small"))
+
+
+@functools.lru_cache(maxsize=1)
+def get_vectordb():
+    if VECTOR_BACKEND == "numpy":
+        from src.numpy_vector_store import NumpyVectorStore
+
+        return NumpyVectorStore.load(VECTOR_INDEX_DIR, get_embedding())
+    if VECTOR_BACKEND == "chroma":
+        from langchain_chroma import Chroma
+
+        return Chroma(persist_directory=PERSIST_DIR, embedding_function=get_embedding())
+    raise ValueError(f"Unknown VECTOR_BACKEND {VECTOR_BACKEND!r}, expected 'numpy' or 'chroma'")
+
+
+def split_policy_doc(doc_path: str) -> list:
+    """One policy document in the chunks that get embedded, the same for every backend."""
+    from langchain_community.document_loaders import TextLoader
+    from src.policy_ingest import split_documents
+
+    return split_documents(TextLoader(doc_path, autodetect_encoding=True).load())
+
+
+def ingestion_target():
+    """Where ingest_policies writes, for the configured VECTOR_BACKEND."""
+    from src.policy_ingest import ChromaTarget, NumpyIndexTarget
+
+    if VECTOR_BACKEND == "numpy":
+        return NumpyIndexTarget(VECTOR_INDEX_DIR, get_embedding(), VECTOR_INDEX_DTYPE)
+    if VECTOR_BACKEND == "chroma":
+        return ChromaTarget(PERSIST_DIR, get_embedding())
+    raise ValueError(f"Unknown VECTOR_BACKEND {VECTOR_BACKEND!r}, expected 'numpy' or 'chroma'")
+
+
+def embedding_cache_stats() -> dict:
+    if get_embedding.cache_info().currsize == 0:
+        return {"loaded": False}
+    embedding = get_embedding()
+    return embedding.stats() if hasattr(embedding, "stats") else {"enabled": False}
+
+
+# Report of the latest ingest_policies run
+last_ingestion = None
 
 
 def download_rag_doc():
-    # Combine the directory and file name to get the full path
-    DOC_PATH = os.path.join(SAVE_DIR, FILE_NAME)
     if not os.path.exists(DOC_PATH):
         # Create the directory if it doesn't exist
         os.makedirs(SAVE_DIR, exist_ok=True)
@@ -38,25 +93,24 @@ def download_rag_doc():
     else:
         print("RAG doc already exists locally.")
 
-    # Check if the database already exists
-    if not os.path.exists(PERSIST_DIR):
-        # Load and embed the doc list to vector db
-        # loader = DirectoryLoader(SAVE_DIR, glob="**/*.md", loader_cls=TextLoader,
-        #                          loader_kwargs={"autodetect_encoding": True}, use_multithreading=True,
-        #                          show_progress=True)
-        # docs = loader.load()
-        # print(docs[0].page_content[:100])
-        raw_documents = TextLoader(DOC_PATH, autodetect_encoding=True).load()
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-        documents = text_splitter.split_documents(raw_documents)
-
-        os.makedirs(PERSIST_DIR, exist_ok=True)
-
-        # Persist the Database
-        Chroma.from_documents(documents=documents, embedding=embedding, persist_directory=PERSIST_DIR)
-        print("Vector database created and persisted.")
-    else:
-        print("Vector database already exists.")
+    # Every start: embed new or changed chunks of the documents in SAVE_DIR and drop deleted ones.
+    # With nothing changed this only hashes the chunks.
+    from src.policy_ingest import ingest_policies
+
+    global last_ingestion
+    last_ingestion = ingest_policies(SAVE_DIR, get_embedding(), ingestion_target(), before_write=release_vectordb)
+    if last_ingestion["added"] or last_ingestion["deleted"]:
+        # Reopen the store and rebuild the BM25 index over the new chunks on next use
+        get_vectordb.cache_clear()
+        get_retriever.cache_clear()
+
+
+def release_vectordb():
+    """Close the cached store before its files are replaced; it is reopened on next use."""
+    if get_vectordb.cache_info().currsize and VECTOR_BACKEND == "numpy":
+        get_vectordb().close()
+    get_vectordb.cache_clear()
+    get_retriever.cache_clear()
 
 # download_rag_doc()
 # print(docs[0].page_content[:100])
@@ -68,13 +122,53 @@ def download_rag_doc():
 ## https://github.com/hwchase17/chroma-langchain/blob/master/persistent-qa.ipynb
 
 # Test Run
-vectordb = Chroma(persist_directory="./src/vector_db", embedding_function=embedding)
-query = "Refund Policy for the flight ticket"
-# docs = vectordb.similarity_search(query=query, k=4)
+# query = "Refund Policy for the flight ticket"
+# docs = get_vectordb().similarity_search(query=query, k=4)
+
+
+# BM25 over the same chunks as the vector store, used first and fused with the vector results
+@functools.lru_cache(maxsize=1)
+def get_retriever():
+    from src.hybrid_retriever import HybridRetriever
+    from src.policy_ingest import load_policy_chunks
+
+    return HybridRetriever(load_policy_chunks(SAVE_DIR), get_vectordb())
+
+
+def retrieval_stats() -> dict:
+    if get_retriever.cache_info().currsize == 0:
+        return {"loaded": False}
+    return get_retriever().stats()
+
+
+def search_policy(query: str) -> str:
+    docs = get_retriever().search(query, k=4)
+    return "\n\n".join([doc.page_content for doc in docs])
 
+
+# Searches the latest user message in the background while the assistant decides what to look up
+policy_prefetcher = PolicyPrefetcher(search_policy)
+
+
+def _thread_id(config: RunnableConfig):
+    return config.get("configurable", {}).get("thread_id")
+
+
+async def alookup_policy(query: str, config: RunnableConfig) -> str:
+    prefetched = await policy_prefetcher.atake(_thread_id(config), query)
+    if prefetched is not None:
+        return prefetched
+    # A confident BM25 match needs no embedding; otherwise the query embedding is a native async request
+    docs = await get_retriever().asearch(query, k=4)
+    return "\n\n".join([doc.page_content for doc in docs])
+
+
+@with_coroutine(alookup_policy)
 @tool
-def lookup_policy(query: str) -> str:
+def lookup_policy(query: str, config: RunnableConfig) -> str:
     """Consult the company policies to check whether certain options are permitted.
     Use this before making any flight changes performing other 'write' events."""
-    docs = vectordb.similarity_search(query, k=4)
-    return "\n\n".join([doc.page_content for doc in docs])
+    prefetched = policy_prefetcher.take(_thread_id(config), query)
+    if prefetched is not None:
+        return prefetched
+    return search_policy(query)
@@ -0,0 +1,67 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from src import sqlite_pool
+from src.sqlite_tools import SEARCH_FLIGHTS_OUTPUT, search_flights
+
+
+@pytest.fixture
+def flights_db(tmp_path, monkeypatch):
+    """A flights table of 45 ZRH departures, several sharing a departure time, behind the shared pool."""
+    path = str(tmp_path / "travel2.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE flights (flight_id INTEGER PRIMARY KEY, flight_no TEXT, scheduled_departure TEXT, "
+        "scheduled_arrival TEXT, departure_airport TEXT, arrival_airport TEXT, status TEXT, aircraft_code TEXT, "
+        "actual_departure TEXT, actual_arrival TEXT)"
+    )
+    start = datetime(2026, 11, 1, 8, 0)
+    conn.executemany(
+        "INSERT INTO flights VALUES (?, ?, ?, ?, 'ZRH', ?, 'Scheduled', '320', NULL, NULL)",
+        [
+            (flight_id, f"LX{1000 + flight_id}", str(start + timedelta(hours=flight_id // 3)),
+             str(start + timedelta(hours=flight_id // 3 + 2)), ["BSL", "GVA", "LUG"][flight_id % 3])
+            for flight_id in range(1, 46)
+        ],
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(sqlite_pool, "_pool", sqlite_pool.ConnectionPool(path, size=2))
+    return [flight_id for flight_id in range(1, 46)]
+
+
+def test_pages_under_a_small_token_budget_skip_no_flight(flights_db, monkeypatch):
+    # Room for a few flights only, far fewer than the requested page size
+    monkeypatch.setattr(SEARCH_FLIGHTS_OUTPUT, "max_tokens", 200)
+
+    seen, page_sizes, token = [], [], None
+    while True:
+        args = {"departure_airport": "ZRH", "limit": 20}
+        if token:
+            args["page_token"] = token
+        page = search_flights.invoke(args)
+        seen += [flight["flight_id"] for flight in page["flights"]]
+        page_sizes.append(len(page["flights"]))
+        token = page["next_page_token"]
+        if token is None:
+            break
+        assert len(page_sizes) < 50, "paging did not terminate"
+
+    assert seen == flights_db
+    assert max(page_sizes) < 20
+    assert all("aircraft_code" not in flight for flight in page["flights"])
+
+
+def test_full_pages_without_budget_pressure(flights_db, monkeypatch):
+    monkeypatch.setattr(SEARCH_FLIGHTS_OUTPUT, "max_tokens", None)
+
+    first = search_flights.invoke({"departure_airport": "ZRH", "limit": 20})
+    second = search_flights.invoke({"departure_airport": "ZRH", "limit": 20, "page_token": first["next_page_token"]})
+    third = search_flights.invoke({"departure_airport": "ZRH", "limit": 20, "page_token": second["next_page_token"]})
+
+    assert [len(page["flights"]) for page in (first, second, third)] == [20, 20, 5]
+    assert third["next_page_token"] is None
+    assert [f["flight_id"] for page in (first, second, third) for f in page["flights"]] == flights_db
+